@@ -0,0 +1,474 @@
+"""
+Benchmarks of the saleos pipeline stages.
+
+Every stage runs on synthetic fixtures, so no input data or network is
+needed: a replicated `inputs.parameters` grid, a lognormal population
+raster and a grid of square regions. Each (stage, scale) case runs in a
+fresh process, which makes its peak RSS its own. Runs are appended to a
+JSON history and compared with the previous run of the same case, so a
+slowdown or memory growth between versions is flagged.
+
+"""
+import argparse
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+HISTORY = "benchmark_history.json"
+
+SCALES = {
+    "small": {"replicas": 1, "raster": 500, "regions": 25, "constellations": 1},
+    "medium": {"replicas": 10, "raster": 2000, "regions": 100, "constellations": 2},
+    "large": {"replicas": 30, "raster": 4000, "regions": 400, "constellations": 3},
+}
+
+# Slowdown or memory growth, relative to the previous run, flagged as a regression.
+THRESHOLD = 0.2
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB, None if unknown.
+
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_parameters(replicas):
+    """
+    `inputs.parameters` with every constellation repeated `replicas` times.
+
+    """
+    from inputs import parameters
+
+    return {"{}_{}".format(key, i): dict(item, name = "{}_{}".format(item["name"], i))
+            for i in range(replicas) for key, item in parameters.items()}
+
+
+def synthetic_scenarios(replicas):
+    """
+    The scenario grid of the synthetic parameters as one DataFrame.
+
+    """
+    from uq_inputs import generate_scenarios
+
+    return pd.concat(generate_scenarios(synthetic_parameters(replicas)))
+
+
+def synthetic_raster(folder, side):
+    """
+    Write a side x side lognormal population raster over Kenya.
+
+    """
+    import rasterio
+    from rasterio.transform import from_origin
+
+    path = os.path.join(folder, "population.tif")
+    data = np.random.default_rng(0).lognormal(2, 1, (side, side)).astype("float32")
+    profile = dict(driver = "GTiff", height = side, width = side, count = 1, dtype = "float32",
+                   crs = "epsg:4326", transform = from_origin(34, 5, 8 / side, 8 / side), nodata = -1)
+
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+
+    return path
+
+
+def synthetic_regions(count):
+    """
+    A grid of about `count` square regions covering the synthetic raster.
+
+    """
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    side = int(math.ceil(math.sqrt(count)))
+    size = 8 / side
+    geometries = [box(34 + i * size, -3 + j * size, 34 + (i + 1) * size, -3 + (j + 1) * size)
+                  for j in range(side) for i in range(side)][:count]
+    gids = ["KEN.{}_1".format(i + 1) for i in range(len(geometries))]
+
+    return gpd.GeoDataFrame({"GID_1": gids, "GID_2": gids, "NAME_1": gids},
+                            geometry = geometries, crs = "epsg:4326")
+
+
+def synthetic_population(count):
+    """
+    Population table of `count` regions.
+
+    """
+    rng = np.random.default_rng(0)
+
+    return pd.DataFrame({"GID_1": ["KEN.{}_1".format(i + 1) for i in range(count)],
+                         "NAME_1": ["Region {}".format(i + 1) for i in range(count)],
+                         "population": rng.uniform(1e5, 2e6, count),
+                         "pop_density": rng.uniform(5, 500, count)})
+
+
+def setup_generate(scale, folder):
+    """
+    Synthetic parameters to generate the scenario grid of.
+
+    """
+    return synthetic_parameters(scale["replicas"])
+
+
+def run_generate(params):
+    """
+    Generate the scenario grid.
+
+    """
+    from uq_inputs import generate_scenarios
+
+    return sum(len(chunk) for chunk in generate_scenarios(params))
+
+
+def setup_link_budget(scale, folder):
+    """
+    Radio input columns of the synthetic scenario grid.
+
+    """
+    import link_budget as lb
+
+    df = synthetic_scenarios(scale["replicas"])
+
+    return {column: df[column].to_numpy() for column in lb.RADIO_COLUMNS}
+
+
+def run_link_budget(columns):
+    """
+    Run the radio chain.
+
+    """
+    import link_budget as lb
+
+    lb.capacity_columns(columns)
+
+    return len(next(iter(columns.values())))
+
+
+def setup_cost_model(scale, folder):
+    """
+    Cost input columns of the synthetic scenario grid.
+
+    """
+    import link_budget as lb
+
+    df = synthetic_scenarios(scale["replicas"])
+
+    return [df[column].to_numpy() for column in lb.COST_COLUMNS]
+
+
+def run_cost_model(columns):
+    """
+    Run the cost model.
+
+    """
+    import link_budget as lb
+
+    lb.cost_model(*columns)
+
+    return len(columns[0])
+
+
+def setup_evaluate(scale, folder):
+    """
+    Synthetic scenario grid.
+
+    """
+    return synthetic_scenarios(scale["replicas"])
+
+
+def run_evaluate(df):
+    """
+    Evaluate capacity and cost together.
+
+    """
+    import link_budget as lb
+
+    return len(lb.evaluate(df))
+
+
+def setup_zonal(scale, folder, method):
+    """
+    Synthetic raster and regions.
+
+    """
+    return (synthetic_raster(folder, scale["raster"]), synthetic_regions(scale["regions"]), method)
+
+
+def run_zonal(fixture):
+    """
+    Sum the population of every region.
+
+    """
+    from population import process_population_tif
+
+    path, regions, method = fixture
+    process_population_tif(path, regions, "GID_2", method = method)
+
+    return len(regions)
+
+
+def setup_integration(scale, folder):
+    """
+    Synthetic population and model results.
+
+    """
+    import link_budget as lb
+    from integration import RESULT_COLUMNS
+
+    results = lb.evaluate(synthetic_scenarios(scale["replicas"]))
+
+    return synthetic_population(scale["regions"]), results[["constellation"] + RESULT_COLUMNS]
+
+
+def run_integration(fixture):
+    """
+    Broadcast every scenario against every region.
+
+    """
+    from integration import integrate, scenario_table
+
+    population, results = fixture
+
+    return len(integrate(population, scenario_table(results, None)))
+
+
+def setup_maps(scale, folder):
+    """
+    Synthetic regions and final tables of the constellations.
+
+    """
+    from inputs import parameters
+    from maps import METRIC_SPECS, batch_specs
+
+    regions = synthetic_regions(scale["regions"])
+    regions[["GID_2", "geometry"]].to_file(os.path.join(folder, "regions_2_KEN.shp"))
+
+    rng = np.random.default_rng(0)
+    names = [item["name"] for item in parameters.values()][:scale["constellations"]]
+    for name in names:
+        data = pd.DataFrame({"GID_1": regions["GID_2"]})
+        for metric, spec in METRIC_SPECS.items():
+            data[metric] = rng.uniform(spec["bins"][0], spec["bins"][-2], len(data))
+        data.to_csv(os.path.join(folder, "{}_final_final.csv".format(name)), index = False)
+
+    return batch_specs(names), folder
+
+
+def run_maps(fixture):
+    """
+    Render every map of the fixture against an empty offline tile store.
+
+    """
+    from maps import render_batch
+
+    specs, folder = fixture
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        paths = render_batch(specs, folder, folder, os.path.join(folder, "figures"),
+                             tiles = os.path.join(folder, "tiles"), offline = True)
+
+    return len(paths)
+
+
+# Stage name to (setup, run, unit). Setup builds the fixture untimed, run
+# processes it and returns the number of units processed.
+STAGES = {
+    "generate": (setup_generate, run_generate, "rows"),
+    "link_budget": (setup_link_budget, run_link_budget, "rows"),
+    "cost_model": (setup_cost_model, run_cost_model, "rows"),
+    "evaluate": (setup_evaluate, run_evaluate, "rows"),
+    "zonal_window": (lambda scale, folder: setup_zonal(scale, folder, "window"), run_zonal, "regions"),
+    "zonal_bincount": (lambda scale, folder: setup_zonal(scale, folder, "bincount"), run_zonal, "regions"),
+    "integration": (setup_integration, run_integration, "rows"),
+    "maps": (setup_maps, run_maps, "maps"),
+}
+
+
+def run_case(stage, scale, repeat = 3):
+    """
+    Time one stage at one scale, keeping the fastest of `repeat` runs.
+
+    Returns
+    -------
+    result : dict
+        Stage, scale, units processed, seconds, throughput, and the peak
+        RSS before and after running the stage.
+    """
+    setup, run, unit = STAGES[stage]
+
+    with tempfile.TemporaryDirectory() as folder:
+        fixture = setup(SCALES[scale], folder)
+        baseline = peak_rss_mb()
+
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items = run(fixture)
+            seconds.append(time.perf_counter() - start)
+
+    best = min(seconds)
+
+    return {
+        "stage": stage,
+        "scale": scale,
+        "unit": unit,
+        "items": items,
+        "seconds": best,
+        "throughput": items / best if best > 0 else None,
+        "setup_rss_mb": baseline,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def isolated_case(stage, scale, repeat = 3):
+    """
+    Run a case in a fresh process, so its peak RSS is its own.
+
+    """
+    with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_case, stage, scale, repeat).result()
+
+
+def git_revision():
+    """
+    Short hash of the checked out commit, None outside a git checkout.
+
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+                              check = True, cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path = HISTORY):
+    """
+    Previous benchmark runs, oldest first.
+
+    """
+    if not os.path.exists(path):
+        return []
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(history, path = HISTORY):
+    """
+    Write the benchmark history, replacing the file atomically.
+
+    """
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(history, f, indent = 1)
+    os.replace(temp, path)
+
+
+def compare(history, results, threshold = THRESHOLD):
+    """
+    Compare results with the latest earlier run of each case.
+
+    Parameters
+    ----------
+    history : list
+        Earlier runs, oldest first.
+    results : list
+        Case results of the current run.
+    threshold : float
+        Relative loss of throughput or growth of peak RSS flagged as a
+        regression.
+
+    Returns
+    -------
+    comparison : DataFrame
+        One row per case with the previous and current throughput and
+        peak RSS, their ratios and a regression flag.
+    """
+    previous = {}
+    for run in history:
+        for result in run["results"]:
+            previous[(result["stage"], result["scale"])] = result
+
+    rows = []
+    for result in results:
+        before = previous.get((result["stage"], result["scale"]), {})
+        speed = (result["throughput"] / before["throughput"]
+                 if before.get("throughput") and result["throughput"] else np.nan)
+        memory = (result["peak_rss_mb"] / before["peak_rss_mb"]
+                  if before.get("peak_rss_mb") and result["peak_rss_mb"] else np.nan)
+        rows.append({
+            "stage": result["stage"],
+            "scale": result["scale"],
+            "throughput": result["throughput"],
+            "unit": "{}/s".format(result["unit"]),
+            "peak_rss_mb": result["peak_rss_mb"],
+            "speed_ratio": speed,
+            "memory_ratio": memory,
+            "regression": bool(speed < 1 - threshold or memory > 1 + threshold),
+        })
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Benchmark the pipeline stages on synthetic fixtures")
+    parser.add_argument("--stages", nargs = "+", choices = list(STAGES), default = list(STAGES))
+    parser.add_argument("--scales", nargs = "+", choices = list(SCALES), default = ["small", "medium"])
+    parser.add_argument("--repeat", type = int, default = 3,
+                        help = "runs per case, the fastest is kept")
+    parser.add_argument("--history", default = HISTORY,
+                        help = "JSON file the run is appended to")
+    parser.add_argument("--threshold", type = float, default = THRESHOLD,
+                        help = "relative slowdown or memory growth flagged as a regression")
+    parser.add_argument("--check", action = "store_true",
+                        help = "exit with an error when a regression is found")
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        for stage in args.stages:
+            results.append(isolated_case(stage, scale, args.repeat))
+            print ("{stage:>15} {scale:>7}: {items:>9} {unit} in {seconds:.3f} s".format(**results[-1]))
+
+    history = load_history(args.history)
+    comparison = compare(history, results, args.threshold)
+    print (comparison.to_string(index = False))
+
+    history.append({
+        "timestamp": datetime.datetime.now().isoformat(timespec = "seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    })
+    save_history(history, args.history)
+
+    if args.check and comparison["regression"].any():
+        sys.exit(1)
@@ -0,0 +1,100 @@
+"""
+Boundary store shared by the visualization modules.
+
+Each GADM boundary file is parsed once per process and kept in memory,
+indexed by its GID column. A GeoParquet copy can be kept next to the
+shapefile so later processes skip the shapefile parser as well.
+
+"""
+import functools
+import os
+import geopandas as gpd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def _geoparquet_path(path):
+    """
+    Path of the GeoParquet copy of a boundary file.
+
+    """
+    return os.path.splitext(path)[0] + '.parquet'
+
+
+@functools.lru_cache(maxsize = None)
+def _read(path, gid_column, geoparquet):
+    """
+    Read a boundary file once and index it by its GID column.
+
+    """
+    parquet = _geoparquet_path(path)
+    use_parquet = geoparquet and pyarrow is not None
+
+    if use_parquet and os.path.exists(parquet) and os.path.getmtime(parquet) >= os.path.getmtime(path):
+        data = gpd.read_parquet(parquet)
+    else:
+        data = gpd.read_file(path)
+        if use_parquet:
+            data.to_parquet(parquet)
+
+    return data.set_index(gid_column, drop = False)
+
+
+def read_boundaries(path, gid_column, geoparquet = False):
+    """
+    Load boundaries, parsing each file at most once per process.
+
+    Parameters
+    ----------
+    path : string
+        Path of the boundary shapefile.
+    gid_column : string
+        GID column used as the index, e.g. 'GID_2'.
+    geoparquet : bool
+        Keep a GeoParquet copy next to the shapefile and read it while it
+        is newer than the shapefile.
+
+    Returns
+    -------
+    boundaries : GeoDataFrame
+        Shallow copy of the cached boundaries, sharing their column data.
+    """
+    return _read(os.path.abspath(path), gid_column, geoparquet).copy(deep = False)
+
+
+def regional_shapes(data_geo, level = 2, iso3 = 'KEN', geoparquet = False):
+    """
+    Load regional shapes keyed by a 'GID_1' column.
+
+    The result CSVs key every region by 'GID_1', whatever the GADM level,
+    so the GID of the requested level is exposed under that name.
+
+    Parameters
+    ----------
+    data_geo : string
+        Folder holding the regions_<level>_<iso3>.shp files.
+    level : int
+        GADM level to load.
+    iso3 : string
+        Country ISO3 code.
+    geoparquet : bool
+        Keep and read a GeoParquet copy of the shapefile.
+
+    Returns
+    -------
+    regions : GeoDataFrame
+        'GID_1' and geometry columns, indexed by the GID of the level.
+    """
+    gid_column = 'GID_{}'.format(level)
+    path = os.path.join(data_geo, 'regions_{}_{}.shp'.format(level, iso3))
+
+    data = read_boundaries(path, gid_column, geoparquet)
+    regions = data[['geometry']].copy(deep = False)
+    regions.insert(0, 'GID_1', data[gid_column])
+    if regions.crs is None:
+        regions = regions.set_crs('epsg:4326')
+
+    return regions
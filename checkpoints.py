@@ -0,0 +1,138 @@
+"""
+Checkpoints of long parameter sweeps.
+
+Each evaluated chunk is written as its own part table, and a JSON
+manifest lists the parameter row ranges whose parts are complete. Parts
+and the manifest are written to temporary files and renamed into place,
+so a run killed at any point leaves a consistent checkpoint behind: at
+worst the chunks in flight are evaluated again when the run resumes.
+
+The manifest also records a signature of the run, such as the parameter
+source, chunk size and model version, and a checkpoint is only resumed
+by a run with the same signature.
+
+"""
+import json
+import os
+import shutil
+from collections import deque
+from table_io import read_table, table_path, write_table
+
+MANIFEST = "manifest.json"
+
+
+def chunk_range(chunk):
+    """
+    First and past-the-end row numbers of a parameter chunk.
+
+    """
+    return int(chunk.index[0]), int(chunk.index[-1]) + 1
+
+
+def _replace_json(data, path):
+    """
+    Atomically replace a JSON file.
+
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f, indent = 1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class Checkpoint:
+    """
+    Completed chunks of a sweep, stored as part tables under `root`.
+
+    Parameters
+    ----------
+    root : string
+        Folder of the checkpoint.
+    signature : dict
+        JSON-serializable description of the run.
+    fmt : string
+        Table format of the parts.
+    resume : bool
+        Keep the completed chunks of an earlier run with the same
+        signature. Otherwise any earlier checkpoint is discarded.
+    """
+    def __init__(self, root, signature, fmt = "feather", resume = False):
+
+        self.root = root
+        self.signature = signature
+        self.fmt = fmt
+        self.chunks = []
+        self.pending = deque()
+        manifest = os.path.join(root, MANIFEST)
+
+        if resume and os.path.exists(manifest):
+            with open(manifest) as f:
+                data = json.load(f)
+            if data["signature"] != signature or data["format"] != fmt:
+                raise ValueError("the checkpoint in {} is of a different run, "
+                                 "remove it or run without resuming".format(root))
+            self.chunks = [tuple(chunk) for chunk in data["chunks"]]
+        elif os.path.exists(root):
+            shutil.rmtree(root)
+
+        os.makedirs(root, exist_ok = True)
+        self.done = set(self.chunks)
+
+    def __contains__(self, key):
+
+        return key in self.done
+
+    def __len__(self):
+
+        return len(self.chunks)
+
+    def _stem(self, key):
+        """
+        Path of the part of a chunk without extension.
+
+        """
+        return os.path.join(self.root, "{:012d}".format(key[0]))
+
+    def remaining(self, chunks):
+        """
+        Skip completed chunks, queueing the others for `save` in order.
+
+        """
+        for chunk in chunks:
+            key = chunk_range(chunk)
+            if key in self.done:
+                continue
+            self.pending.append(key)
+            yield chunk
+
+    def save(self, results):
+        """
+        Store the results of the oldest queued chunk and record it as done.
+
+        """
+        key = self.pending.popleft()
+        stem = self._stem(key)
+        write_table(results, stem + ".tmp", self.fmt)
+        os.replace(table_path(stem + ".tmp", self.fmt), table_path(stem, self.fmt))
+
+        self.chunks.append(key)
+        self.done.add(key)
+        _replace_json({"signature": self.signature, "format": self.fmt, "chunks": self.chunks},
+                      os.path.join(self.root, MANIFEST))
+
+    def results(self):
+        """
+        Results of the completed chunks, one part at a time in row order.
+
+        """
+        for key in sorted(self.chunks):
+            yield read_table(self._stem(key), self.fmt)
+
+    def remove(self):
+        """
+        Delete the checkpoint, once its results are written elsewhere.
+
+        """
+        shutil.rmtree(self.root, ignore_errors = True)
@@ -0,0 +1,91 @@
+"""
+Summary cubes of the model results.
+
+A cube holds the count, mean and sd of every metric for each
+constellation and each level of each scenario dimension, e.g. the
+channel capacity of Starlink in the "Low (<7.5 dB)" cnr scenario. It is
+updated one result chunk at a time, with Welford moments merged per
+group, so the summaries come out of the run that produces the results
+instead of repeated group-bys over the full table.
+
+"""
+import pandas as pd
+from sketches import RunningMoments
+
+CUBE_DIMENSIONS = ["cnr_scenario", "capex_scenario", "opex_scenario", "cost_scenario"]
+
+CUBE_METRICS = [
+    "channel capacity", "single_satellite_capacity_in_Gbps", "constelation_capacity",
+    "capacity_area_GBps", "cost_model", "total_emissions_kg",
+]
+
+CUBE_COLUMNS = ["constellation", "dimension", "scenario", "metric", "count", "mean", "sd"]
+
+
+class SummaryCube:
+    """
+    Streaming mean and sd of metrics per constellation and scenario level.
+
+    Parameters
+    ----------
+    dimensions : list
+        Scenario columns, each summarized on its own.
+    metrics : list
+        Metric columns to summarize.
+    group : string
+        Column every summary is also grouped by.
+    """
+    def __init__(self, dimensions = CUBE_DIMENSIONS, metrics = CUBE_METRICS, group = "constellation"):
+
+        self.dimensions = list(dimensions)
+        self.metrics = list(metrics)
+        self.group = group
+        self.moments = {}
+
+    def update(self, df):
+        """
+        Add a chunk of results. Dimensions or metrics it lacks are skipped.
+
+        """
+        metrics = [metric for metric in self.metrics if metric in df.columns]
+
+        for dimension in self.dimensions:
+            if dimension not in df.columns:
+                continue
+
+            grouped = df.groupby([self.group, dimension], sort = False, observed = True)[metrics]
+            count = grouped.count()
+            counts = count.to_numpy()
+            means = grouped.mean().reindex(count.index).to_numpy(dtype = float)
+            m2s = grouped.var(ddof = 0).reindex(count.index).to_numpy(dtype = float) * counts
+
+            for i, (group, level) in enumerate(count.index):
+                for j, metric in enumerate(metrics):
+                    if counts[i, j] == 0:
+                        continue
+                    batch = RunningMoments()
+                    batch.count, batch.mean, batch.m2 = int(counts[i, j]), means[i, j], m2s[i, j]
+                    self.moments.setdefault((group, dimension, level, metric), RunningMoments()).merge(batch)
+
+        return self
+
+    def merge(self, other):
+        """
+        Combine with the cube of other results.
+
+        """
+        for key, moments in other.moments.items():
+            self.moments.setdefault(key, RunningMoments()).merge(moments)
+
+        return self
+
+    def to_frame(self):
+        """
+        The cube as a long table with the `CUBE_COLUMNS` columns.
+
+        """
+        rows = [(group, dimension, level, metric, moments.count, moments.mean, moments.sd)
+                for (group, dimension, level, metric), moments in self.moments.items()]
+        cube = pd.DataFrame(rows, columns = CUBE_COLUMNS).rename(columns = {"constellation": self.group})
+
+        return cube.sort_values(list(cube.columns[:4]), kind = "stable", ignore_index = True)
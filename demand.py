@@ -0,0 +1,326 @@
+"""
+Demand and capacity feasibility of every region, subscriber level and scenario.
+
+Each subscriber level of a scenario is spread over the regions by
+population, and an extra 'adoption' level takes the constellation's
+adoption rate of each region's population. Users ask for their
+busy-hour share of the monthly traffic, and the supply of a region is
+the scenario's capacity per area over the region's area. Per (region,
+subscriber level, scenario) this gives the shortfall, the utilisation,
+the capacity per active user after overbooking, and the monthly price
+per served user that breaks even with the scenario's discounted cost.
+
+Scenarios are taken a chunk at a time, as (regions, levels, scenarios)
+arrays, and folded into per (constellation, region, level) summaries,
+so the full cube is never held in memory.
+
+"""
+import argparse
+import numpy as np
+import pandas as pd
+import link_budget as lb
+from inputs import parameters
+from registry import load, records
+from table_io import FORMATS, TableWriter, iter_table, write_table
+
+path = "C:/Users/bmwan/Desktop/5.2/Link Budget/"
+
+SUBSCRIBER_LEVELS = ["subscribers_low", "subscribers_baseline", "subscribers_high", "adoption"]
+
+PARAMETER_COLUMNS = ["constellation", "subscribers_low", "subscribers_baseline", "subscribers_high",
+                     "monthly_traffic_GB", "percent_of_traffic", "discount_rate", "assessment_period_year"]
+
+RESULT_COLUMNS = ["capacity_area_GBps", "cost_model"]
+
+DEMAND_COLUMNS = ["users", "demand_Mbps", "supply_Mbps", "shortfall_Mbps", "utilisation",
+                  "capacity_per_active_user_Mbps", "break_even_monthly_cost"]
+
+SUMMARY_COLUMNS = ["constellation", "GID_1", "subscriber_scenario", "scenarios", "feasible_share",
+                   "mean_shortfall_Mbps", "mean_utilisation", "mean_capacity_per_active_user_Mbps",
+                   "mean_break_even_monthly_cost"]
+
+DAYS_PER_MONTH = 30
+
+
+def busy_hour_demand(monthly_traffic_GB, percent_of_traffic):
+    """
+    Busy-hour data rate of a user in Mbps.
+
+    A day's share of the monthly traffic, of which `percent_of_traffic`
+    percent falls in the busiest hour.
+
+    """
+    return monthly_traffic_GB * 8000 / DAYS_PER_MONTH * (percent_of_traffic / 100) / 3600
+
+
+def scenario_inputs(scenarios, constellations):
+    """
+    Demand inputs of a chunk of scenarios, one array per input.
+
+    Parameters
+    ----------
+    scenarios : DataFrame
+        Scenario rows with the `PARAMETER_COLUMNS` and `RESULT_COLUMNS`.
+    constellations : recarray
+        Registry supplying the adoption rate and overbooking factor of
+        each constellation.
+
+    Returns
+    -------
+    inputs : dict
+        Arrays of shape (scenarios,), and the subscribers of every level
+        as 'subscribers', shape (levels - 1, scenarios).
+    """
+    constellations = records(constellations)
+    names = pd.Index(constellations["name"])
+    index = names.get_indexer(scenarios["constellation"].astype(str))
+    if (index < 0).any():
+        raise ValueError("constellations missing from the registry: {}".format(
+            sorted(set(scenarios["constellation"].astype(str)[index < 0]))))
+
+    return {
+        "subscribers": scenarios[SUBSCRIBER_LEVELS[:-1]].to_numpy(dtype = float).T,
+        "adoption_rate": constellations["adoption_rate"][index],
+        "overbooking_factor": constellations["overbooking_factor"][index].astype(float),
+        "user_demand_Mbps": busy_hour_demand(scenarios["monthly_traffic_GB"].to_numpy(dtype = float),
+                                             scenarios["percent_of_traffic"].to_numpy(dtype = float)),
+        "annuity": 12 * lb.discount_factor_sum(scenarios["discount_rate"], scenarios["assessment_period_year"]),
+        "capacity_area_GBps": scenarios["capacity_area_GBps"].to_numpy(dtype = float),
+        "cost_model": scenarios["cost_model"].to_numpy(dtype = float),
+    }
+
+
+def demand_cube(population, area_km2, inputs):
+    """
+    Demand and supply of every (region, subscriber level, scenario).
+
+    Parameters
+    ----------
+    population : array
+        Population of each region, shape (regions,).
+    area_km2 : array
+        Area of each region, shape (regions,).
+    inputs : dict
+        Scenario inputs from `scenario_inputs`. 'capacity_area_GBps' is
+        in Mbps/km^2, as from `link_budget.capacity_area`, and may also
+        have shape (regions, scenarios), e.g. from
+        `geometry.regional_capacity`.
+
+    Returns
+    -------
+    cube : dict
+        `DEMAND_COLUMNS` to arrays of shape (regions, levels, scenarios).
+    """
+    population = np.asarray(population, dtype = float)
+    share = (population / population.sum())[:, None, None]
+
+    users = np.concatenate([share * inputs["subscribers"][None],
+                            population[:, None, None] * inputs["adoption_rate"][None, None]], axis = 1)
+    demand = users * inputs["user_demand_Mbps"]
+
+    capacity = np.asarray(inputs["capacity_area_GBps"], dtype = float)
+    capacity = capacity[None, None] if capacity.ndim == 1 else capacity[:, None]
+    supply = np.broadcast_to(capacity * np.asarray(area_km2, dtype = float)[:, None, None], users.shape)
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        utilisation = demand / supply
+        per_active_user = supply / (users / inputs["overbooking_factor"])
+        served = users * np.minimum(1, 1 / utilisation)
+        break_even = inputs["cost_model"] * share / (inputs["annuity"] * served)
+
+    return {
+        "users": users,
+        "demand_Mbps": demand,
+        "supply_Mbps": supply,
+        "shortfall_Mbps": np.maximum(demand - supply, 0),
+        "utilisation": utilisation,
+        "capacity_per_active_user_Mbps": per_active_user,
+        "break_even_monthly_cost": break_even,
+    }
+
+
+def cube_frame(regions, scenarios, cube):
+    """
+    A demand cube as a long table, one row per (scenario, level, region),
+    indexed by the scenario's row number.
+
+    """
+    n_regions, n_levels, n_scenarios = cube["users"].shape
+    frame = pd.DataFrame({
+        "constellation": np.repeat(scenarios["constellation"].astype(str).to_numpy(), n_levels * n_regions),
+        "subscriber_scenario": np.tile(np.repeat(SUBSCRIBER_LEVELS, n_regions), n_scenarios),
+        "GID_1": np.tile(regions, n_levels * n_scenarios),
+    }, index = np.repeat(scenarios.index.to_numpy(), n_levels * n_regions))
+    for column, values in cube.items():
+        frame[column] = values.transpose(2, 1, 0).ravel()
+
+    return frame
+
+
+class DemandSummary:
+    """
+    Running feasibility summary per constellation, region and subscriber level.
+
+    The means leave out the NaN and infinite values of a region without
+    supply or without users, e.g. a region of zero population, and are
+    NaN where no scenario has a finite value.
+
+    Parameters
+    ----------
+    regions : array
+        GID of each region, in the order of the cube's first axis.
+    """
+    # Summed cube columns, averaged over their finite values.
+    means = {
+        "shortfall": "shortfall_Mbps",
+        "utilisation": "utilisation",
+        "per_active_user": "capacity_per_active_user_Mbps",
+        "break_even": "break_even_monthly_cost",
+    }
+
+    def __init__(self, regions):
+
+        self.regions = np.asarray(regions)
+        self.sums = {}
+
+    def mean(self, sums, key):
+        """
+        Mean of a summed column over its finite values.
+
+        """
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return (sums[key] / sums[key + "_count"]).ravel()
+
+    def update(self, constellation, cube):
+        """
+        Add the cube of a chunk of scenarios of one constellation.
+
+        """
+        sums = self.sums.setdefault(constellation, {})
+        values = {
+            "scenarios": np.full(cube["users"].shape[:2], cube["users"].shape[2], dtype = float),
+            "feasible": (cube["shortfall_Mbps"] == 0).sum(axis = 2),
+        }
+        for key, column in self.means.items():
+            finite = np.isfinite(cube[column])
+            values[key] = np.where(finite, cube[column], 0).sum(axis = 2)
+            values[key + "_count"] = finite.sum(axis = 2)
+        for key, value in values.items():
+            sums[key] = sums.get(key, 0) + value
+
+        return self
+
+    def to_frame(self):
+        """
+        The summary as a long table with the `SUMMARY_COLUMNS`.
+
+        """
+        frames = []
+
+        for constellation, sums in self.sums.items():
+            count = sums["scenarios"]
+            n_regions, n_levels = count.shape
+            frames.append(pd.DataFrame({
+                "constellation": constellation,
+                "GID_1": np.repeat(self.regions, n_levels),
+                "subscriber_scenario": np.tile(SUBSCRIBER_LEVELS, n_regions),
+                "scenarios": count.ravel().astype(np.int64),
+                "feasible_share": (sums["feasible"] / count).ravel(),
+                "mean_shortfall_Mbps": self.mean(sums, "shortfall"),
+                "mean_utilisation": self.mean(sums, "utilisation"),
+                "mean_capacity_per_active_user_Mbps": self.mean(sums, "per_active_user"),
+                "mean_break_even_monthly_cost": self.mean(sums, "break_even"),
+            }))
+
+        return pd.concat(frames, ignore_index = True)[SUMMARY_COLUMNS]
+
+
+def scenario_chunks(stem, fmt = "csv", chunk_size = 1000):
+    """
+    Read uq_parameters and uq_results side by side in chunks.
+
+    Parameters
+    ----------
+    stem : string
+        Folder holding both tables, ending with a separator.
+    fmt : string
+        Table format of both tables.
+    chunk_size : int
+        Scenarios per chunk.
+
+    Yields
+    ------
+    scenarios : DataFrame
+        `PARAMETER_COLUMNS` and `RESULT_COLUMNS` of consecutive rows.
+    """
+    parameters_chunks = iter_table(stem + "uq_parameters", fmt, chunk_size, PARAMETER_COLUMNS)
+    result_chunks = iter_table(stem + "uq_results", fmt, chunk_size, RESULT_COLUMNS)
+
+    for scenarios, results in zip(parameters_chunks, result_chunks):
+        if not scenarios.index.equals(results.index):
+            raise ValueError("uq_results must have one row per uq_parameters row, in the same order")
+        yield scenarios.join(results)
+
+
+def feasibility(population, chunks, constellations = parameters, writer = None):
+    """
+    Summarize the demand cube of every chunk of scenarios.
+
+    Parameters
+    ----------
+    population : DataFrame
+        One row per region with GID_1, population and pop_density.
+    chunks : iterable
+        Scenario DataFrames, e.g. from `scenario_chunks`.
+    constellations : dict
+        Constellation parameters or registry record array.
+    writer : TableWriter
+        Writer of the full cube as a long table, if any.
+
+    Returns
+    -------
+    summary : DataFrame
+        Summary with the `SUMMARY_COLUMNS`.
+    """
+    constellations = records(constellations)
+    population_counts = population["population"].to_numpy(dtype = float)
+    density = population["pop_density"].to_numpy(dtype = float)
+    # Regions of zero density have no area to supply.
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        area = np.where(density > 0, population_counts / density, 0)
+    summary = DemandSummary(population["GID_1"].to_numpy())
+
+    for chunk in chunks:
+        for constellation, scenarios in chunk.groupby("constellation", sort = False, observed = True):
+            cube = demand_cube(population_counts, area, scenario_inputs(scenarios, constellations))
+            summary.update(str(constellation), cube)
+            if writer is not None:
+                writer.write(cube_frame(summary.regions, scenarios, cube))
+
+    return summary.to_frame()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Check regional demand against the capacity of every scenario")
+    parser.add_argument("--format", choices = list(FORMATS), default = "csv",
+                        help = "table format of uq_parameters, uq_results and the outputs")
+    parser.add_argument("--chunk-size", type = int, default = 1000,
+                        help = "scenarios evaluated at a time")
+    parser.add_argument("--registry", nargs = "+", default = [], metavar = "FILE",
+                        help = "TOML or JSON constellation files adding to, or overriding, inputs.parameters")
+    parser.add_argument("--cube", action = "store_true",
+                        help = "also write every (region, subscriber level, scenario) to demand_cube")
+    args = parser.parse_args()
+
+    population = pd.read_csv(path + "population.csv")
+    chunks = scenario_chunks(path + "results/", args.format, args.chunk_size)
+    constellations = load(args.registry, parameters)
+
+    if args.cube:
+        with TableWriter(path + "results/demand_cube", args.format) as writer:
+            summary = feasibility(population, chunks, constellations, writer)
+    else:
+        summary = feasibility(population, chunks, constellations)
+
+    write_table(summary, path + "results/demand_summary", args.format)
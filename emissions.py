@@ -0,0 +1,126 @@
+"""
+Launch emissions of the saleos simulation.
+
+Each launch vehicle burns its propellants from the fuel mass columns of
+the parameter table: `fuel_mass_kg` for the first stages, and
+`fuel_mass_1_kg` to `fuel_mass_3_kg` for the other stages and boosters.
+The emissions of a scenario are its number of missions times the mass of
+each propellant burnt per launch times that propellant's emission
+factors. Like the link budget functions, everything broadcasts over
+parameter columns, so emissions are evaluated in the same pass as the
+capacity and cost.
+
+"""
+import numpy as np
+
+# Exhaust mass of each species per kg of propellant burnt. Approximate
+# mass fractions from the launch emission literature, meant to be tuned.
+EMISSION_FACTORS = {
+    "kerosene": {"co2": 0.30, "co": 0.35, "h2o": 0.30, "black_carbon": 0.02},
+    "hypergolic": {"co2": 0.15, "co": 0.10, "h2o": 0.31, "nox": 0.01},
+    "solid": {"co2": 0.03, "co": 0.24, "h2o": 0.09, "al2o3": 0.30, "hcl": 0.21},
+    "cryogenic": {"h2o": 0.98},
+}
+
+EMISSION_SPECIES = ["co2", "co", "h2o", "black_carbon", "nox", "al2o3", "hcl"]
+
+# Propellant burnt from each fuel mass column, per launch vehicle.
+LAUNCH_VEHICLES = {
+    "Falcon 9": {"fuel_mass_kg": "kerosene"},
+    "Soyuz-FG": {"fuel_mass_kg": "kerosene", "fuel_mass_1_kg": "hypergolic"},
+    "Ariane 5": {"fuel_mass_1_kg": "hypergolic", "fuel_mass_2_kg": "solid", "fuel_mass_3_kg": "cryogenic"},
+}
+
+CONSTELLATION_VEHICLES = {"Starlink": "Falcon 9", "OneWeb": "Soyuz-FG", "Kuiper": "Ariane 5"}
+
+# Used for constellations without a launch vehicle: the propellant each
+# fuel mass column holds in `inputs.parameters`.
+DEFAULT_PROPELLANTS = {"fuel_mass_kg": "kerosene", "fuel_mass_1_kg": "hypergolic",
+                       "fuel_mass_2_kg": "solid", "fuel_mass_3_kg": "cryogenic"}
+
+FUEL_COLUMNS = list(DEFAULT_PROPELLANTS)
+
+EMISSION_COLUMNS = ["{}_emissions_kg".format(species) for species in EMISSION_SPECIES] + [
+    "total_emissions_kg", "emissions_per_satellite_kg", "emissions_per_subscriber_kg"]
+
+
+def vehicle_factors(constellation):
+    """
+    Emission factors of each fuel mass column for a constellation's launch vehicle.
+
+    Returns
+    -------
+    factors : array
+        Shape (fuel columns, species), in `FUEL_COLUMNS` and
+        `EMISSION_SPECIES` order.
+    """
+    vehicle = CONSTELLATION_VEHICLES.get(constellation)
+    propellants = LAUNCH_VEHICLES[vehicle] if vehicle is not None else DEFAULT_PROPELLANTS
+    factors = np.zeros((len(FUEL_COLUMNS), len(EMISSION_SPECIES)))
+
+    for i, column in enumerate(FUEL_COLUMNS):
+        if column in propellants:
+            for species, factor in EMISSION_FACTORS[propellants[column]].items():
+                factors[i, EMISSION_SPECIES.index(species)] = factor
+
+    return factors
+
+
+def launch_emissions(constellation, fuel_masses, number_of_missions):
+    """
+    Emissions of every species over all the missions of each scenario, in kg.
+
+    Parameters
+    ----------
+    constellation : array
+        Constellation name of each scenario, shape (scenarios,).
+    fuel_masses : array
+        Fuel mass per launch of each `FUEL_COLUMNS` column in kg, shape
+        (scenarios, fuel columns).
+    number_of_missions : array
+        Launches of each scenario, shape (scenarios,).
+
+    Returns
+    -------
+    emissions : array
+        Shape (scenarios, species), in `EMISSION_SPECIES` order.
+    """
+    constellation = np.asarray(constellation).astype(str)
+    names, codes = np.unique(constellation, return_inverse = True)
+    table = np.zeros((len(names), len(FUEL_COLUMNS), len(EMISSION_SPECIES)))
+    for i, name in enumerate(names):
+        table[i] = vehicle_factors(name)
+    factors = table[codes.ravel()]
+
+    per_launch = np.einsum("sf,sfe->se", np.asarray(fuel_masses, dtype = float), factors)
+
+    return per_launch * np.asarray(number_of_missions, dtype = float)[:, None]
+
+
+def emission_columns(columns):
+    """
+    Evaluate the launch emissions of a mapping of parameter columns.
+
+    Parameters
+    ----------
+    columns : DataFrame or dict
+        Parameter columns named as in `uq_parameters.csv`, of shape
+        (scenarios,).
+
+    Returns
+    -------
+    results : dict
+        `EMISSION_COLUMNS` to arrays.
+    """
+    emissions = launch_emissions(columns["constellation"],
+                                 np.stack([np.asarray(columns[column], dtype = float) for column in FUEL_COLUMNS],
+                                          axis = -1),
+                                 columns["number_of_missions"])
+
+    results = {"{}_emissions_kg".format(species): emissions[:, i] for i, species in enumerate(EMISSION_SPECIES)}
+    total = emissions.sum(axis = 1)
+    results["total_emissions_kg"] = total
+    results["emissions_per_satellite_kg"] = total / np.asarray(columns["number_of_satellites"], dtype = float)
+    results["emissions_per_subscriber_kg"] = total / np.asarray(columns["subscribers_baseline"], dtype = float)
+
+    return results
@@ -0,0 +1,334 @@
+"""
+Geometry of the constellation shells seen from each region.
+
+The base link budget puts every user directly under a satellite at the
+constellation altitude, and spreads the satellites evenly over the
+Earth. Here each shell is a Walker constellation at its own altitude and
+inclination, and each region is seen from its latitude. Per (region,
+shell) this gives the slant range and free space loss at the minimum
+elevation of the terminals, the highest elevation the shell ever
+reaches, and the expected number of satellites in view. The number in
+view follows from the latitude distribution of a circular inclined
+orbit, integrated over the cap of sky above the minimum elevation.
+
+Everything is evaluated as (regions, shells, elevations) arrays, so all
+regions of a country, or of Africa, take one vectorized pass.
+
+"""
+import argparse
+import numpy as np
+import pandas as pd
+import link_budget as lb
+from inputs import parameters
+from registry import load, records
+from table_io import FORMATS, write_table
+
+path = "C:/Users/bmwan/Desktop/5.2/Link Budget/"
+
+DATA_GEO = "C:/Users/bmwan/Desktop/5.2/Link_Budget/data/shapefiles"
+
+EARTH_RADIUS_KM = 6371
+
+# Shells of each constellation as (altitude_km, inclination_deg, satellites),
+# from the FCC filings matching the satellite counts of inputs.parameters.
+SHELLS = {
+    "Starlink": [(550, 53, 1600), (1110, 53.8, 1600), (1130, 74, 400), (1275, 81, 375), (1325, 70, 450)],
+    "OneWeb": [(1200, 87.9, 720)],
+    "Kuiper": [(590, 33, 784), (610, 42, 1296), (630, 51.9, 1156)],
+}
+
+# Minimum elevation of the user terminals in degrees.
+MIN_ELEVATION = {"Starlink": 25, "OneWeb": 55, "Kuiper": 35}
+
+# Used for constellations without filed shells: one shell at the registry
+# altitude with all the satellites.
+DEFAULT_INCLINATION = 53
+DEFAULT_MIN_ELEVATION = 25
+
+ELEVATIONS = np.arange(0, 91, 5)
+
+SHELL_COLUMNS = ["constellation", "shell", "altitude_km", "inclination_deg", "number_of_satellites",
+                 "min_elevation_deg", "dl_frequency_Hz"]
+
+
+def shell_table(params = parameters):
+    """
+    One row per shell of every constellation, with the `SHELL_COLUMNS`.
+
+    Parameters
+    ----------
+    params : dict
+        Constellation parameters or registry record array.
+    """
+    rows = []
+
+    for item in records(params):
+        name = str(item["name"])
+        shells = SHELLS.get(name, [(item["altitude_km"], DEFAULT_INCLINATION, item["number_of_satellites"])])
+        for shell, (altitude, inclination, satellites) in enumerate(shells):
+            rows.append((name, shell, altitude, inclination, satellites,
+                         MIN_ELEVATION.get(name, DEFAULT_MIN_ELEVATION), item["dl_frequency"]))
+
+    return pd.DataFrame(rows, columns = SHELL_COLUMNS)
+
+
+def slant_range(altitude_km, elevation_deg):
+    """
+    Distance in km from a user to a satellite seen at an elevation angle.
+
+    """
+    orbit = EARTH_RADIUS_KM + np.asarray(altitude_km, dtype = float)
+    elevation = np.radians(elevation_deg)
+
+    return np.sqrt(orbit ** 2 - (EARTH_RADIUS_KM * np.cos(elevation)) ** 2) - EARTH_RADIUS_KM * np.sin(elevation)
+
+
+def central_angle(altitude_km, elevation_deg):
+    """
+    Earth central angle in radians between a user and a satellite seen at an elevation.
+
+    """
+    ratio = EARTH_RADIUS_KM / (EARTH_RADIUS_KM + np.asarray(altitude_km, dtype = float))
+    elevation = np.radians(elevation_deg)
+
+    return np.arccos(ratio * np.cos(elevation)) - elevation
+
+
+def elevation_angle(altitude_km, central_angle):
+    """
+    Elevation in degrees of a satellite at an Earth central angle from the user.
+
+    """
+    ratio = EARTH_RADIUS_KM / (EARTH_RADIUS_KM + np.asarray(altitude_km, dtype = float))
+
+    return np.degrees(np.arctan2(np.cos(central_angle) - ratio, np.sin(central_angle)))
+
+
+def max_elevation(latitude_deg, altitude_km, inclination_deg):
+    """
+    Highest elevation a shell reaches from a latitude, in degrees.
+
+    Satellites never pass over latitudes beyond the inclination, so
+    users further from the equator see them lower in the sky.
+
+    """
+    inclination = np.minimum(inclination_deg, 180 - np.asarray(inclination_deg, dtype = float))
+    gap = np.radians(np.maximum(np.abs(latitude_deg) - inclination, 0))
+
+    return elevation_angle(altitude_km, gap)
+
+
+def _latitude_cdf(latitude, inclination):
+    """
+    Share of the time a circular orbit spends below a latitude, both in radians.
+
+    """
+    return 0.5 + np.arcsin(np.clip(np.sin(latitude) / np.sin(inclination), -1, 1)) / np.pi
+
+
+def visible_satellites(latitude_deg, altitude_km, inclination_deg, satellites, min_elevation_deg, strips = 64):
+    """
+    Expected number of satellites of a shell above the minimum elevation.
+
+    Satellites of a Walker shell are spread evenly in longitude, and in
+    latitude as a circular orbit of its inclination. The cap of sky above
+    the minimum elevation is cut into latitude strips, each holding the
+    share of satellites in its latitude band times its share of the
+    longitudes. Arguments broadcast against each other.
+
+    """
+    latitude = np.radians(latitude_deg)[..., None]
+    inclination = np.radians(np.minimum(inclination_deg, 180 - np.asarray(inclination_deg, dtype = float)))[..., None]
+    cap = central_angle(altitude_km, min_elevation_deg)[..., None]
+
+    edges = latitude + cap * np.linspace(-1, 1, strips + 1)
+    edges = np.clip(edges, -np.pi / 2, np.pi / 2)
+    middle = (edges[..., 1:] + edges[..., :-1]) / 2
+    share = np.diff(_latitude_cdf(edges, inclination), axis = -1)
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        cos_width = (np.cos(cap) - np.sin(latitude) * np.sin(middle)) / (np.cos(latitude) * np.cos(middle))
+    width = np.arccos(np.clip(np.nan_to_num(cos_width, nan = -1), -1, 1))
+
+    return np.asarray(satellites, dtype = float) * np.sum(share * width / np.pi, axis = -1)
+
+
+def region_geometry(latitude_deg, shells, elevations = ELEVATIONS):
+    """
+    Geometry of every shell seen from every region.
+
+    Parameters
+    ----------
+    latitude_deg : array
+        Latitude of each region, e.g. of its centroid, shape (regions,).
+    shells : DataFrame
+        Shells with the `SHELL_COLUMNS`, e.g. from `shell_table`.
+    elevations : array
+        Elevation samples in degrees.
+
+    Returns
+    -------
+    geometry : dict
+        'slant_range_km' and 'path_loss' of shape (regions, shells,
+        elevations), NaN at elevations below the minimum or above the
+        highest the shell reaches. 'min_slant_range_km', 'min_path_loss',
+        'max_elevation_deg', 'visible_satellites' and
+        'coverage_area_per_sat_sqkm' of shape (regions, shells), the
+        ranges and losses being those at the minimum elevation.
+    """
+    latitude = np.asarray(latitude_deg, dtype = float)[:, None]
+    altitude = shells["altitude_km"].to_numpy(dtype = float)[None, :]
+    inclination = shells["inclination_deg"].to_numpy(dtype = float)[None, :]
+    minimum = shells["min_elevation_deg"].to_numpy(dtype = float)[None, :]
+    frequency = shells["dl_frequency_Hz"].to_numpy(dtype = float)[None, :]
+    elevations = np.asarray(elevations, dtype = float)
+
+    highest = max_elevation(latitude, altitude, inclination)
+    reachable = (elevations >= minimum[..., None]) & (elevations <= highest[..., None])
+    distance = np.where(reachable, slant_range(altitude[..., None], elevations), np.nan)
+
+    visible = visible_satellites(latitude, altitude, inclination,
+                                 shells["number_of_satellites"].to_numpy(dtype = float)[None, :], minimum)
+    cap_area = 2 * np.pi * EARTH_RADIUS_KM ** 2 * (1 - np.cos(central_angle(altitude, minimum)))
+    with np.errstate(divide = "ignore"):
+        coverage = np.where(visible > 0, cap_area / visible, np.inf)
+
+    min_distance = np.broadcast_to(slant_range(altitude, minimum), highest.shape)
+
+    return {
+        "slant_range_km": distance,
+        "path_loss": lb.path_loss(distance, frequency[..., None]),
+        "min_slant_range_km": min_distance,
+        "min_path_loss": lb.path_loss(min_distance, frequency),
+        "max_elevation_deg": highest,
+        "visible_satellites": visible,
+        "coverage_area_per_sat_sqkm": coverage,
+    }
+
+
+def geometry_table(regions, shells, latitude_column = "latitude"):
+    """
+    The (regions, shells) geometry as a long table.
+
+    Parameters
+    ----------
+    regions : DataFrame
+        One row per region with a GID_1 and a latitude column.
+    shells : DataFrame
+        Shells with the `SHELL_COLUMNS`.
+    latitude_column : string
+        Column of the region latitudes.
+
+    Returns
+    -------
+    table : DataFrame
+        One row per (region, shell), region-major.
+    """
+    geometry = region_geometry(regions[latitude_column], shells)
+    n_regions, n_shells = len(regions), len(shells)
+
+    table = pd.concat([
+        regions[["GID_1", latitude_column]].iloc[np.repeat(np.arange(n_regions), n_shells)].reset_index(drop = True),
+        shells[["constellation", "shell", "altitude_km", "inclination_deg"]].iloc[
+            np.tile(np.arange(n_shells), n_regions)].reset_index(drop = True),
+    ], axis = 1)
+    for column in ["max_elevation_deg", "min_slant_range_km", "min_path_loss", "visible_satellites",
+                   "coverage_area_per_sat_sqkm"]:
+        table[column] = geometry[column].ravel()
+
+    return table
+
+
+def region_centroids(regions):
+    """
+    Latitude and longitude of the centroid of each region.
+
+    Centroids are taken in an equal-area projection, then returned in
+    degrees as 'latitude' and 'longitude' columns next to GID_1.
+
+    """
+    centroids = regions.geometry.to_crs("+proj=cea").centroid.to_crs("epsg:4326")
+
+    return pd.DataFrame({"GID_1": regions["GID_1"].to_numpy(), "latitude": centroids.y.to_numpy(),
+                         "longitude": centroids.x.to_numpy()})
+
+
+def regional_capacity(df, regions, shells, latitude_column = "latitude", constellations = parameters):
+    """
+    Capacity per area of every parameter row in every region.
+
+    Each shell is evaluated through the radio chain with its slant range
+    at the minimum elevation and the area per satellite in view from the
+    region, and the capacities per area of the shells are summed. The
+    shells of a row are moved by the row's `altitude_km` offset from the
+    constellation's registry altitude, so the altitude scenarios are
+    swept here too.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Parameter rows, as in `uq_parameters`.
+    regions : DataFrame
+        One row per region with a GID_1 and a latitude column.
+    shells : DataFrame
+        Shells with the `SHELL_COLUMNS`.
+    latitude_column : string
+        Column of the region latitudes.
+    constellations : dict
+        Constellation parameters or registry record array giving the
+        baseline altitude of each constellation.
+
+    Returns
+    -------
+    capacity : DataFrame
+        One row per (parameter row, region) with the row number, GID_1,
+        constellation, satellites in view and capacity_area_GBps.
+    """
+    constellations = records(constellations)
+    baseline = dict(zip(constellations["name"].tolist(), constellations["altitude_km"].tolist()))
+    frames = []
+
+    for constellation, group in df.groupby("constellation", sort = False, observed = True):
+        shell = shells[shells["constellation"] == constellation]
+        if not len(shell):
+            continue
+
+        for altitude, rows in group.groupby("altitude_km", sort = False):
+            moved = shell.assign(altitude_km = shell["altitude_km"] + altitude - baseline[constellation])
+            geometry = region_geometry(regions[latitude_column], moved)
+
+            columns = {column: rows[column].to_numpy()[:, None, None] for column in lb.RADIO_COLUMNS}
+            columns["slant_range_km"] = geometry["min_slant_range_km"][None]
+            columns["coverage_area_per_sat_sqkm"] = geometry["coverage_area_per_sat_sqkm"][None]
+            columns["number_of_satellites"] = shell["number_of_satellites"].to_numpy(dtype = float)[None, None, :]
+            capacity = lb.capacity_columns(columns)["capacity_area_GBps"].sum(axis = 2)
+
+            frames.append(pd.DataFrame({
+                "row": np.repeat(rows.index.to_numpy(), len(regions)),
+                "GID_1": np.tile(regions["GID_1"].to_numpy(), len(rows)),
+                "constellation": constellation,
+                "visible_satellites": np.tile(geometry["visible_satellites"].sum(axis = 1), len(rows)),
+                "capacity_area_GBps": capacity.ravel(),
+            }))
+
+    return pd.concat(frames, ignore_index = True)
+
+
+if __name__ == '__main__':
+
+    from boundaries import regional_shapes
+
+    parser = argparse.ArgumentParser(description = "Write the shell geometry seen from every region")
+    parser.add_argument("--level", type = int, default = 2,
+                        help = "GADM level of the regions")
+    parser.add_argument("--iso3", default = "KEN",
+                        help = "country of the regions")
+    parser.add_argument("--registry", nargs = "+", default = [], metavar = "FILE",
+                        help = "TOML or JSON constellation files adding to, or overriding, inputs.parameters")
+    parser.add_argument("--format", choices = list(FORMATS), default = "csv",
+                        help = "table format of region_geometry")
+    args = parser.parse_args()
+
+    regions = region_centroids(regional_shapes(DATA_GEO, args.level, args.iso3))
+    shells = shell_table(load(args.registry, parameters))
+    write_table(geometry_table(regions, shells), path + "results/region_geometry", args.format)
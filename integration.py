@@ -0,0 +1,291 @@
+"""
+Integration of the link budget results with the regional population.
+
+Scenario results are reduced to one row per scenario key, then every
+scenario is broadcast against every region to give the per-user
+capacity, cost and traffic of each (region, scenario) pair in one
+vectorized step. The tidy result holds one row per pair, keyed by the
+region GID and the scenario columns.
+
+The distribution mode keeps every scenario instead. The per-user metrics
+of a region are the scenario results scaled by positive region
+constants, so their mean, sd and quantiles are those of the results,
+scaled the same way. Streaming the results once through a moments
+tracker and a quantile sketch per scenario key and result column is
+therefore enough, whatever the number of scenarios or draws.
+
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from sketches import QuantileSketch, RunningMoments
+from table_io import FORMATS, iter_table, read_table, write_table
+
+path = "C:/Users/bmwan/Desktop/5.2/Link Budget/"
+
+DATA_PROCESS = "C:/Users/bmwan/Desktop/5.2/Link_Budget/data"
+
+REGION_COLUMNS = ["GID_1", "NAME_1", "population", "pop_density"]
+
+SCENARIO_KEYS = ["constellation"]
+
+RESULT_COLUMNS = ["capacity_area_GBps", "cost_model"]
+
+METRIC_COLUMNS = ["capacity_user_Mbps", "cost_per_user", "monthly_traffic_GBPs"]
+
+# Column names used by the *_final_final.csv files read by the map renderer.
+FINAL_COLUMNS = {"capacity_user_Mbps": "capacity_user_mbps", "monthly_traffic_GBPs": "monthly_traffic_GB"}
+
+# Share of the busy hour capacity a user consumes over the month, in percent.
+PERCENT_OF_TRAFFIC = 20
+
+QUANTILES = {"p5": 0.05, "p50": 0.5, "p95": 0.95}
+
+STATISTICS = ["mean", "sd"] + list(QUANTILES)
+
+
+def scenario_table(results, keys = SCENARIO_KEYS, agg = "max"):
+    """
+    Reduce the model results to one row per scenario key.
+
+    Parameters
+    ----------
+    results : DataFrame
+        Model results with the `keys` and `RESULT_COLUMNS` columns.
+    keys : list
+        Columns identifying a scenario. None keeps every result row as
+        its own scenario.
+    agg : string
+        Aggregation applied to each result column within a scenario.
+
+    Returns
+    -------
+    scenarios : DataFrame
+        The key columns followed by the aggregated result columns.
+    """
+    if keys is None:
+        return results.reset_index(drop = True)
+
+    return results.groupby(list(keys), sort = False, observed = True)[RESULT_COLUMNS].agg(agg).reset_index()
+
+
+def region_metrics(pop_density, population, capacity_area_GBps, cost_model,
+                   percent_of_traffic = PERCENT_OF_TRAFFIC):
+    """
+    Per-user metrics of every (region, scenario) pair.
+
+    Region inputs are arrays of shape (regions,) and scenario inputs of
+    shape (scenarios,). Outputs have shape (regions, scenarios).
+    `capacity_area_GBps` is in Mbps/km^2, as from
+    `link_budget.capacity_area`, so dividing by the population density
+    in people/km^2 gives Mbps per user.
+
+    Returns
+    -------
+    metrics : dict
+        Capacity per user in Mbps, cost per user and monthly traffic per
+        user in GB.
+    """
+    pop_density = np.asarray(pop_density, dtype = float)[:, None]
+    population = np.asarray(population, dtype = float)[:, None]
+    capacity_area_GBps = np.asarray(capacity_area_GBps, dtype = float)[None, :]
+    cost_model = np.asarray(cost_model, dtype = float)[None, :]
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        capacity_user_Mbps = capacity_area_GBps / pop_density
+        cost_per_user = cost_model / population
+
+    monthly_traffic_GBPs = capacity_user_Mbps * 30 * 3600 * (percent_of_traffic / 100) / 1000
+
+    return {
+        "capacity_user_Mbps": capacity_user_Mbps,
+        "cost_per_user": cost_per_user,
+        "monthly_traffic_GBPs": monthly_traffic_GBPs,
+    }
+
+
+def integrate(population, scenarios, region_columns = REGION_COLUMNS, percent_of_traffic = PERCENT_OF_TRAFFIC):
+    """
+    Broadcast every scenario against every region.
+
+    Parameters
+    ----------
+    population : DataFrame
+        One row per region with the `REGION_COLUMNS` columns.
+    scenarios : DataFrame
+        One row per scenario, e.g. from `scenario_table`.
+    region_columns : list
+        Region columns copied to the output when present.
+    percent_of_traffic : float
+        Share of the capacity per user consumed over the month, in percent.
+
+    Returns
+    -------
+    tidy : DataFrame
+        One row per (scenario, region) pair, scenario-major, with the
+        region columns, the scenario columns and `METRIC_COLUMNS`.
+    """
+    regions = population[[column for column in region_columns if column in population.columns]]
+    n_regions, n_scenarios = len(regions), len(scenarios)
+
+    metrics = region_metrics(population["pop_density"], population["population"],
+                             scenarios["capacity_area_GBps"], scenarios["cost_model"], percent_of_traffic)
+
+    tidy = pd.concat([
+        regions.iloc[np.tile(np.arange(n_regions), n_scenarios)].reset_index(drop = True),
+        scenarios.iloc[np.repeat(np.arange(n_scenarios), n_regions)].reset_index(drop = True),
+    ], axis = 1)
+
+    for column, values in metrics.items():
+        tidy[column] = values.T.ravel()
+
+    return tidy
+
+
+def scenario_sketches(chunks, keys = SCENARIO_KEYS, k = 200):
+    """
+    Stream result chunks into moments and quantile sketches per scenario key.
+
+    Parameters
+    ----------
+    chunks : iterable
+        DataFrames of model results, e.g. from `table_io.iter_table`.
+        Monte Carlo results work the same way, one row per draw.
+    keys : list
+        Columns identifying the distributions to summarize.
+    k : int
+        Size of the quantile sketches.
+
+    Returns
+    -------
+    sketches : dict
+        Key tuple to a dict of result column to (RunningMoments,
+        QuantileSketch).
+    """
+    sketches = {}
+
+    for chunk in chunks:
+        for key, group in chunk.groupby(list(keys), sort = False, observed = True):
+            summaries = sketches.setdefault(key, {column: (RunningMoments(), QuantileSketch(k))
+                                                  for column in RESULT_COLUMNS})
+            for column, (moments, sketch) in summaries.items():
+                values = group[column].to_numpy(dtype = float)
+                moments.update(values)
+                sketch.update(values)
+
+    return sketches
+
+
+def summary_statistics(moments, sketch):
+    """
+    Mean, sd and `QUANTILES` of one summarized stream, in `STATISTICS` order.
+
+    """
+    return np.concatenate([[moments.mean, moments.sd], sketch.quantile(list(QUANTILES.values()))])
+
+
+def region_distribution(population, sketches, keys = SCENARIO_KEYS, region_columns = REGION_COLUMNS,
+                        percent_of_traffic = PERCENT_OF_TRAFFIC):
+    """
+    Distribution of the per-user metrics of every region over all scenarios.
+
+    Parameters
+    ----------
+    population : DataFrame
+        One row per region with the `REGION_COLUMNS` columns.
+    sketches : dict
+        Summaries from `scenario_sketches`.
+    keys : list
+        Scenario key columns of the sketches.
+    region_columns : list
+        Region columns copied to the output when present.
+    percent_of_traffic : float
+        Share of the capacity per user consumed over the month, in percent.
+
+    Returns
+    -------
+    distribution : DataFrame
+        One row per (scenario key, region) with the scenario count and a
+        <metric>_<statistic> column for every metric and statistic.
+    """
+    regions = population[[column for column in region_columns if column in population.columns]]
+    frames = []
+
+    for key, summaries in sketches.items():
+        key = key if isinstance(key, tuple) else (key,)
+        capacity = summary_statistics(*summaries["capacity_area_GBps"])
+        cost = summary_statistics(*summaries["cost_model"])
+
+        # Every statistic is scaled like a single scenario value, since the
+        # metrics are linear in the results with positive coefficients.
+        metrics = region_metrics(population["pop_density"], population["population"],
+                                 capacity, cost, percent_of_traffic)
+
+        frame = regions.reset_index(drop = True)
+        for column, value in zip(keys, key):
+            frame[column] = value
+        frame["scenarios"] = summaries["cost_model"][0].count
+        for column, values in metrics.items():
+            for i, statistic in enumerate(STATISTICS):
+                frame["{}_{}".format(column, statistic)] = values[:, i]
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index = True)
+
+
+def write_final_tables(tidy, folder = DATA_PROCESS):
+    """
+    Write the <constellation>_final_final.csv file of each constellation.
+
+    With scenario keys beyond the constellation, a region has one row
+    per scenario in its constellation's file.
+
+    Returns
+    -------
+    paths : list
+        Paths of the files written.
+    """
+    os.makedirs(folder, exist_ok = True)
+    paths = []
+
+    for constellation, data in tidy.groupby("constellation", sort = False, observed = True):
+        file = os.path.join(folder, "{}_final_final.csv".format(constellation))
+        data.rename(columns = FINAL_COLUMNS).to_csv(file, index = False)
+        paths.append(file)
+
+    return paths
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Integrate the model results with the regional population")
+    parser.add_argument("--format", choices = list(FORMATS), default = "csv",
+                        help = "table format of uq_results and region_results")
+    parser.add_argument("--keys", nargs = "+", default = SCENARIO_KEYS,
+                        help = "result columns identifying a scenario")
+    parser.add_argument("--all-scenarios", action = "store_true",
+                        help = "keep every result row as its own scenario")
+    parser.add_argument("--agg", default = "max",
+                        help = "aggregation of the results within a scenario")
+    parser.add_argument("--distribution", action = "store_true",
+                        help = "summarize every scenario of each key instead of aggregating them")
+    parser.add_argument("--chunk-size", type = int, default = 100000,
+                        help = "rows of uq_results read at a time in distribution mode")
+    args = parser.parse_args()
+
+    keys = None if args.all_scenarios else args.keys
+    population = pd.read_csv(path + "population.csv")
+
+    if args.distribution:
+        chunks = iter_table(path + "results/uq_results", args.format, args.chunk_size,
+                            columns = args.keys + RESULT_COLUMNS)
+        distribution = region_distribution(population, scenario_sketches(chunks, args.keys), args.keys)
+        write_table(distribution, path + "results/region_distribution", args.format)
+    else:
+        results = read_table(path + "results/uq_results", args.format,
+                             columns = None if keys is None else keys + RESULT_COLUMNS)
+
+        tidy = integrate(population, scenario_table(results, keys, args.agg))
+        write_table(tidy, path + "results/region_results", args.format)
+        write_final_tables(tidy)
@@ -0,0 +1,703 @@
+"""
+Link budget and cost functions for the saleos simulation.
+
+Every function accepts scalars, ndarrays or DataFrame columns and
+broadcasts element-wise, so the same code serves the per-row loop in
+`runner.py` and the array pass in `evaluate`.
+
+"""
+import functools
+import numpy as np
+import pandas as pd
+from emissions import emission_columns
+from inputs import lut
+
+SPEED_OF_LIGHT = 3.0 * 10**8  # Speed of light in vacuum (m/s)
+BOLTZMANN = 1.38 * 10**-23  # Boltzmann's constant (J/K)
+NOISE_TEMPERATURE = 290  # Receiver system temperature (K)
+
+
+def _array(value):
+    """
+    Convert scalars, lists and Series into float ndarrays.
+
+    """
+    return np.asarray(value, dtype = float)
+
+
+def _output(value):
+    """
+    Unwrap 0-d arrays so scalar inputs give scalar outputs.
+
+    """
+    return value[()] if np.ndim(value) == 0 else value
+
+
+def path_loss(distance_km, frequency_Hz):
+    """
+    Calculate the free space path loss in dB.
+
+    FSPL(dB) = 20log(d) + 20log(f) + 32.44, with d in km and f in MHz.
+
+    Parameters
+    ----------
+    distance_km : float or array
+        Distance between the satellite and the user in km.
+    frequency_Hz : float or array
+        Downlink frequency in Hertz.
+
+    Returns
+    -------
+    path_loss : float or array
+        Free space path loss in dB.
+    """
+    distance_km = _array(distance_km)
+    frequency_MHz = _array(frequency_Hz) / 10**6
+
+    return _output(20 * np.log10(distance_km) + 20 * np.log10(frequency_MHz) + 32.44)
+
+
+def antenna_gain(antenna_efficiency, antenna_diameter_m, frequency_Hz):
+    """
+    Calculate the parabolic antenna gain in dB.
+
+    Parameters
+    ----------
+    antenna_efficiency : float or array
+        Aperture efficiency of the antenna.
+    antenna_diameter_m : float or array
+        Antenna diameter in metres.
+    frequency_Hz : float or array
+        Downlink frequency in Hertz.
+
+    Returns
+    -------
+    antenna_gain : float or array
+        Antenna gain in dB.
+    """
+    wavelength = SPEED_OF_LIGHT / _array(frequency_Hz)
+    aperture = (np.pi * _array(antenna_diameter_m) / wavelength) ** 2
+
+    return _output(10 * np.log10(_array(antenna_efficiency) * aperture))
+
+
+def total_losses(earth_atmospheric_losses_dB, all_other_losses_dB):
+    """
+    Sum the atmospheric (rain) and all other losses in dB.
+
+    """
+    return _output(_array(earth_atmospheric_losses_dB) + _array(all_other_losses_dB))
+
+
+def eirp(power_dBw, antenna_gain):
+    """
+    Calculate the equivalent isotropically radiated power in dBW.
+
+    """
+    return _output(_array(power_dBw) + _array(antenna_gain))
+
+
+def power_received_user(eirp, path_loss, total_losses, receiver_gain_dB):
+    """
+    Calculate the power received at the user terminal in dBW.
+
+    """
+    received = _array(eirp) + _array(receiver_gain_dB) - _array(path_loss) - _array(total_losses)
+
+    return _output(received)
+
+
+def noise_power(temperature, bandwidth_Hz):
+    """
+    Calculate the thermal noise power (kTB) in dBW.
+
+    Parameters
+    ----------
+    temperature : float or array
+        Receiver system temperature in Kelvin.
+    bandwidth_Hz : float or array
+        Detection bandwidth in Hertz.
+
+    Returns
+    -------
+    noise_power : float or array
+        Noise power in dBW.
+    """
+    return _output(10 * np.log10(BOLTZMANN * _array(temperature) * _array(bandwidth_Hz)))
+
+
+def signal_to_noise_ratio(power_received_user, noise_power):
+    """
+    Calculate the carrier to noise ratio in dB.
+
+    """
+    return _output(_array(power_received_user) - _array(noise_power))
+
+
+class SpectralEfficiencyLUT:
+    """
+    Precompiled CNR to spectral efficiency lookup.
+
+    The table is sorted by CNR once when the object is built. Repeated
+    CNR thresholds keep their highest spectral efficiency, and the
+    efficiency column is then replaced by its running maximum: a terminal
+    that clears a threshold can always fall back to any modulation and
+    coding with a lower threshold, so a higher CNR never maps to a lower
+    efficiency. This resolves the out-of-order rows in `inputs.lut`
+    (e.g. 11.09 dB -> 3.39 bps/Hz ranking above 11.98 dB -> 3.08 bps/Hz).
+
+    Queries below the first threshold take the first efficiency and
+    queries above the last threshold take the last one.
+
+    Parameters
+    ----------
+    table : list of tuples
+        (cnr_dB, spectral_efficiency) pairs in any order.
+    method : string
+        Default interpolation, either 'step' (efficiency of the highest
+        threshold not above the CNR) or 'linear'.
+    """
+    methods = ('step', 'linear')
+
+    def __init__(self, table, method = 'step'):
+
+        if method not in self.methods:
+            raise ValueError("method must be one of {}".format(self.methods))
+
+        table = np.asarray(table, dtype = float)
+        cnr, inverse = np.unique(table[:, 0], return_inverse = True)
+        efficiency = np.full(len(cnr), -np.inf)
+        np.maximum.at(efficiency, inverse, table[:, 1])
+
+        self.cnr = cnr
+        self.efficiency = np.maximum.accumulate(efficiency)
+        self.method = method
+
+        self.cnr.flags.writeable = False
+        self.efficiency.flags.writeable = False
+
+    def __len__(self):
+
+        return len(self.cnr)
+
+    def __call__(self, cnr, method = None):
+        """
+        Look up the spectral efficiency for a batch of CNR values.
+
+        Parameters
+        ----------
+        cnr : float or array
+            Carrier to noise ratio in dB.
+        method : string
+            'step' or 'linear', defaults to the method of the table.
+
+        Returns
+        -------
+        spectral_efficiency : float or array
+            Spectral efficiency in bps/Hz, NaN where the CNR is NaN.
+        """
+        method = self.method if method is None else method
+        cnr = _array(cnr)
+
+        if method == 'step':
+            index = np.searchsorted(self.cnr, cnr, side = 'right') - 1
+            efficiency = self.efficiency[np.clip(index, 0, len(self.cnr) - 1)]
+        elif method == 'linear':
+            efficiency = np.interp(cnr, self.cnr, self.efficiency)
+        else:
+            raise ValueError("method must be one of {}".format(self.methods))
+
+        return _output(np.where(np.isnan(cnr), np.nan, efficiency))
+
+
+SPECTRAL_EFFICIENCY_LUT = SpectralEfficiencyLUT(lut)
+
+
+def spectral_efficiency(signal_to_noise_ratio, method = 'step'):
+    """
+    Look up the spectral efficiency (bps/Hz) for each CNR value.
+
+    Parameters
+    ----------
+    signal_to_noise_ratio : float or array
+        Carrier to noise ratio in dB.
+    method : string
+        'step' or 'linear' interpolation over `SPECTRAL_EFFICIENCY_LUT`.
+
+    Returns
+    -------
+    spectral_efficiency : float or array
+        Spectral efficiency in bps/Hz.
+    """
+    return SPECTRAL_EFFICIENCY_LUT(signal_to_noise_ratio, method)
+
+
+def channel_capacity(spectral_efficiency, dl_bandwidth_Hz):
+    """
+    Calculate the channel capacity in Mbps.
+
+    """
+    return _output(_array(spectral_efficiency) * _array(dl_bandwidth_Hz) / 10**6)
+
+
+def satellite_capacity(spectral_efficiency, dl_bandwidth_Hz, number_of_channels, polarization):
+    """
+    Calculate the capacity of a single satellite in Mbps.
+
+    """
+    capacity = (_array(dl_bandwidth_Hz) / 10**6) * _array(spectral_efficiency) \
+                * _array(number_of_channels) * _array(polarization)
+
+    return _output(capacity)
+
+
+def constellation_capacity(satellite_capacity, number_of_satellites):
+    """
+    Calculate the capacity of the whole constellation in Mbps.
+
+    """
+    return _output(_array(satellite_capacity) * _array(number_of_satellites))
+
+
+def capacity_area(constellation_capacity, coverage_area_sqkm):
+    """
+    Calculate the constellation capacity per unit area (Mbps/km^2).
+
+    """
+    return _output(_array(constellation_capacity) / _array(coverage_area_sqkm))
+
+
+@functools.lru_cache(maxsize = None)
+def discount_series(discount_rate, assessment_period_year):
+    """
+    Annual discount factors 1 / (1 + r)^t for t = 0 .. period - 1.
+
+    Cached per (rate, period) pair, so a series is only derived once.
+
+    Parameters
+    ----------
+    discount_rate : float
+        Discount rate in percent.
+    assessment_period_year : int
+        Number of years assessed.
+
+    Returns
+    -------
+    factors : array
+        Read-only array of the discount factors of each year.
+    """
+    factors = (1 + discount_rate / 100) ** -np.arange(int(assessment_period_year))
+    factors.flags.writeable = False
+
+    return factors
+
+
+def _discount_pairs(discount_rate, assessment_period_year):
+    """
+    Factorize rate and period columns into their unique pairs.
+
+    Returns
+    -------
+    shape : tuple
+        Broadcast shape of the inputs.
+    codes : array
+        Flat index of each element's pair in `pairs`.
+    pairs : list
+        Unique (rate, period) pairs.
+    """
+    rate, period = np.broadcast_arrays(_array(discount_rate), _array(assessment_period_year))
+    rate_codes, rates = pd.factorize(rate.ravel())
+    period_codes, periods = pd.factorize(period.ravel())
+    codes, _ = pd.factorize(rate_codes.astype(np.int64) * len(periods) + period_codes)
+
+    _, first = np.unique(codes, return_index = True)
+    pairs = [(float(rates[rate_codes[i]]), int(periods[period_codes[i]])) for i in first]
+
+    return rate.shape, codes, pairs
+
+
+def discount_factors(discount_rate, assessment_period_year, years = None):
+    """
+    Discount factor matrix of a set of (rate, period) rows.
+
+    Parameters
+    ----------
+    discount_rate : float or array
+        Discount rate in percent.
+    assessment_period_year : int or array
+        Number of years assessed.
+    years : int
+        Number of year columns, defaults to the longest period. Years past
+        a row's period have a factor of zero.
+
+    Returns
+    -------
+    factors : array
+        Array of shape (rows, years).
+    """
+    shape, codes, pairs = _discount_pairs(discount_rate, assessment_period_year)
+    years = max(period for _, period in pairs) if years is None else years
+
+    table = np.zeros((len(pairs), years))
+    for i, pair in enumerate(pairs):
+        series = discount_series(*pair)[:years]
+        table[i, :len(series)] = series
+
+    return table[codes].reshape(shape + (years,))
+
+
+def discount_factor_sum(discount_rate, assessment_period_year):
+    """
+    Sum the annual discount factors 1 / (1 + r)^t for t = 0 .. period - 1.
+
+    The sum is computed once per unique (rate, period) pair and broadcast
+    back, since a parameter table only carries a handful of them.
+
+    Parameters
+    ----------
+    discount_rate : float or array
+        Discount rate in percent.
+    assessment_period_year : int or array
+        Number of years assessed.
+
+    Returns
+    -------
+    discount_factor_sum : float or array
+        Sum of the discount factors.
+    """
+    shape, codes, pairs = _discount_pairs(discount_rate, assessment_period_year)
+    sums = np.array([discount_series(*pair).sum() for pair in pairs])
+
+    return _output(sums[codes].reshape(shape))
+
+
+def capex_cost(satellite_manufacturing, satellite_launch_cost, ground_station_cost,
+               spectrum_cost, regulation_fees, digital_infrastructure_cost):
+    """
+    Sum the capital costs, incurred once in year zero, in USD.
+
+    """
+    capex = _array(satellite_manufacturing) + _array(satellite_launch_cost) \
+            + _array(ground_station_cost) + _array(spectrum_cost) \
+            + _array(regulation_fees) + _array(digital_infrastructure_cost)
+
+    return _output(capex)
+
+
+def annual_opex_cost(ground_station_energy, subscriber_acquisition, staff_costs,
+                     research_development, maintenance_costs):
+    """
+    Sum the operating costs incurred every year, in USD.
+
+    """
+    opex = _array(ground_station_energy) + _array(subscriber_acquisition) \
+           + _array(staff_costs) + _array(research_development) \
+           + _array(maintenance_costs)
+
+    return _output(opex)
+
+
+def cost_model(satellite_manufacturing, satellite_launch_cost, ground_station_cost,
+               spectrum_cost, regulation_fees, digital_infrastructure_cost,
+               ground_station_energy, subscriber_acquisition, staff_costs,
+               research_development, maintenance_costs, discount_rate,
+               assessment_period_year):
+    """
+    Calculate the total cost of ownership of the constellation in USD.
+
+    Capital costs are incurred once. Operating costs are incurred every
+    year of the assessment period and discounted back to year zero.
+
+    Returns
+    -------
+    total_cost_ownership : float or array
+        Capex plus discounted opex in USD.
+    """
+    capex = capex_cost(satellite_manufacturing, satellite_launch_cost, ground_station_cost,
+                       spectrum_cost, regulation_fees, digital_infrastructure_cost)
+
+    annual_opex = annual_opex_cost(ground_station_energy, subscriber_acquisition, staff_costs,
+                                   research_development, maintenance_costs)
+
+    discounted_opex = annual_opex * discount_factor_sum(discount_rate, assessment_period_year)
+
+    return _output(capex + discounted_opex)
+
+
+def cost_cash_flows(satellite_manufacturing, satellite_launch_cost, ground_station_cost,
+                    spectrum_cost, regulation_fees, digital_infrastructure_cost,
+                    ground_station_energy, subscriber_acquisition, staff_costs,
+                    research_development, maintenance_costs, discount_rate,
+                    assessment_period_year, years = None):
+    """
+    Calculate the total cost of ownership and its discounted cash flows.
+
+    Takes the same arguments as `cost_model`, as scalars or columns.
+
+    Parameters
+    ----------
+    years : int
+        Number of year columns, defaults to the longest period.
+
+    Returns
+    -------
+    total_cost_ownership : array
+        Capex plus discounted opex in USD, one value per row.
+    cash_flows : array
+        Discounted cost of each year in USD, shape (rows, years). Year
+        zero includes the capex.
+    """
+    capex = _array(capex_cost(satellite_manufacturing, satellite_launch_cost, ground_station_cost,
+                              spectrum_cost, regulation_fees, digital_infrastructure_cost))
+
+    annual_opex = _array(annual_opex_cost(ground_station_energy, subscriber_acquisition, staff_costs,
+                                          research_development, maintenance_costs))
+
+    factors = discount_factors(discount_rate, assessment_period_year, years)
+
+    cash_flows = annual_opex[..., np.newaxis] * factors
+    cash_flows[..., 0] += capex
+
+    total = capex + annual_opex * discount_factor_sum(discount_rate, assessment_period_year)
+
+    return total, cash_flows
+
+
+# Inputs of the cost model, in the order of its arguments.
+COST_COLUMNS = ["satellite_manufacturing", "satellite_launch_cost", "ground_station_cost",
+                "spectrum_cost", "regulation_fees", "digital_infrastructure_cost",
+                "ground_station_energy", "subscriber_acquisition", "staff_costs",
+                "research_development", "maintenance_costs", "discount_rate",
+                "assessment_period_year"]
+
+PASSTHROUGH_COLUMNS = ["cnr_scenario", "capex_costs", "capex_scenario", "opex_costs",
+                       "opex_scenario", "satellite_launch_cost", "cost_scenario"]
+
+
+# Inputs of the radio chain, the key of the link budget cache.
+RADIO_COLUMNS = ["altitude_km", "dl_frequency_Hz", "antenna_efficiency", "antenna_diameter_m",
+                 "earth_atmospheric_losses_dB", "all_other_losses_dB", "power_dBw",
+                 "receiver_gain_dB", "dl_bandwidth_Hz", "number_of_channels", "polarization",
+                 "number_of_satellites", "coverage_area_per_sat_sqkm"]
+
+# Optional radio inputs, also part of the cache key when given.
+GEOMETRY_COLUMNS = ["slant_range_km"]
+
+CAPACITY_COLUMNS = ["path_loss", "antenna_gain", "total_losses", "eirp", "power_received_user",
+                    "noise_power", "signal_to_noise_ratio", "spectral_efficiency", "channel capacity",
+                    "single_satellite_capacity_in_Gbps", "constelation_capacity", "capacity_area_GBps"]
+
+
+def capacity_columns(columns):
+    """
+    Evaluate the radio chain, from path loss to capacity per area.
+
+    Parameters
+    ----------
+    columns : DataFrame or dict
+        Input columns named as in `uq_parameters.csv`. Values may be
+        arrays of any mutually broadcastable shapes. A 'slant_range_km'
+        column, e.g. from `geometry.region_geometry`, replaces the
+        altitude as the path length.
+
+    Returns
+    -------
+    results : dict
+        Result column name to array, in `uq_results.csv` order.
+    """
+    distance = columns["slant_range_km"] if "slant_range_km" in columns else columns["altitude_km"]
+    pl = path_loss(distance, columns["dl_frequency_Hz"])
+    gain = antenna_gain(columns["antenna_efficiency"], columns["antenna_diameter_m"], columns["dl_frequency_Hz"])
+    losses = total_losses(columns["earth_atmospheric_losses_dB"], columns["all_other_losses_dB"])
+    power = eirp(columns["power_dBw"], gain)
+    received = power_received_user(power, pl, losses, columns["receiver_gain_dB"])
+    noise = noise_power(NOISE_TEMPERATURE, columns["dl_bandwidth_Hz"])
+    snr = signal_to_noise_ratio(received, noise)
+    se = spectral_efficiency(snr)
+    channel = channel_capacity(se, columns["dl_bandwidth_Hz"])
+    sat_capacity = satellite_capacity(se, columns["dl_bandwidth_Hz"], columns["number_of_channels"],
+                                      columns["polarization"])
+    const_capacity = constellation_capacity(sat_capacity, columns["number_of_satellites"])
+    cap_area = capacity_area(const_capacity, columns["coverage_area_per_sat_sqkm"])
+
+    return {"path_loss": pl, "antenna_gain": gain, "total_losses": losses, "eirp": power,
+            "power_received_user": received, "noise_power": noise,
+            "signal_to_noise_ratio": snr, "spectral_efficiency": se,
+            "channel capacity": channel, "single_satellite_capacity_in_Gbps": sat_capacity,
+            "constelation_capacity": const_capacity, "capacity_area_GBps": cap_area}
+
+
+class LinkBudgetCache:
+    """
+    Memoize the radio chain on the unique combinations of its inputs.
+
+    In a scenario grid most rows only differ in their cost inputs, so the
+    radio inputs are deduplicated first, the chain runs once per new
+    combination and the results are broadcast back onto every row.
+    Results are kept across calls.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximum number of cached combinations. The cache is emptied when
+        it would grow past this size.
+    """
+    def __init__(self, max_size = 1000000):
+
+        self.max_size = max_size
+        self.store = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+
+        return len(self.store)
+
+    def clear(self):
+        """
+        Drop all cached results and reset the statistics.
+
+        """
+        self.store.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Cache statistics.
+
+        Returns
+        -------
+        stats : dict
+            `hits` (rows served without evaluating the chain), `misses`
+            (combinations evaluated), `rows`, `hit_rate` and `size`.
+        """
+        rows = self.hits + self.misses
+
+        return {"hits": self.hits, "misses": self.misses, "rows": rows,
+                "hit_rate": self.hits / rows if rows else 0.0, "size": len(self.store)}
+
+    def __call__(self, columns):
+        """
+        Evaluate the radio chain through the cache.
+
+        Takes and returns the same columns as `capacity_columns`.
+
+        """
+        radio = RADIO_COLUMNS + [column for column in GEOMETRY_COLUMNS if column in columns]
+        values = np.broadcast_arrays(*[_array(columns[column]) for column in radio])
+        shape = values[0].shape
+        if values[0].size == 0:
+            return capacity_columns(columns)
+
+        # Hash-factorize column by column into one code per unique row.
+        codes = np.zeros(values[0].size, dtype = np.int64)
+        for value in values:
+            column_codes, uniques = pd.factorize(value.ravel())
+            codes, _ = pd.factorize(codes * len(uniques) + column_codes)
+        _, first = np.unique(codes, return_index = True)
+
+        inputs = np.ascontiguousarray(np.stack([value.ravel()[first] for value in values], axis = 1))
+        keys = [row.tobytes() for row in inputs]
+
+        # Hits are read before any eviction below, so they are not lost.
+        rows = [self.store.get(key) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            if len(self.store) + len(missing) > self.max_size:
+                self.store.clear()
+            computed = capacity_columns(dict(zip(radio, inputs[missing].T)))
+            computed = np.stack([np.broadcast_to(computed[column], (len(missing),))
+                                 for column in CAPACITY_COLUMNS], axis = 1)
+            for i, row in zip(missing, computed):
+                rows[i] = row
+                self.store[keys[i]] = row
+
+        self.misses += len(missing)
+        self.hits += len(codes) - len(missing)
+
+        table = np.stack(rows)[codes]
+
+        return {column: table[:, j].reshape(shape) for j, column in enumerate(CAPACITY_COLUMNS)}
+
+
+RADIO_CACHE = LinkBudgetCache()
+
+
+def evaluate_columns(columns, cache = None, cash_flow_years = None):
+    """
+    Evaluate the link budget and cost model on a mapping of input columns.
+
+    Parameters
+    ----------
+    columns : DataFrame or dict
+        Input columns named as in `uq_parameters.csv`. Values may be
+        arrays of any mutually broadcastable shapes.
+    cache : LinkBudgetCache
+        Cache for the radio chain, None to evaluate every row.
+    cash_flow_years : int
+        Also return this many `discounted_cost_year_<t>` columns.
+
+    Returns
+    -------
+    results : dict
+        Result column name to array, in `uq_results.csv` order.
+    """
+    results = capacity_columns(columns) if cache is None else cache(columns)
+
+    costs = [columns[column] for column in COST_COLUMNS]
+
+    if cash_flow_years is None:
+        results["cost_model"] = cost_model(*costs)
+    else:
+        results["cost_model"], cash_flows = cost_cash_flows(*costs, years = cash_flow_years)
+        for year in range(cash_flow_years):
+            results["discounted_cost_year_{}".format(year)] = cash_flows[..., year]
+
+    return results
+
+
+def evaluate(df, cache = None, cash_flow_years = None, emissions = False):
+    """
+    Evaluate the full link budget and cost model for a parameter table.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Parameter table with the columns written by `uq_inputs.py`.
+    cache : LinkBudgetCache
+        Cache for the radio chain, None to evaluate every row.
+    cash_flow_years : int
+        Also return this many discounted cost columns, one per year.
+    emissions : bool
+        Also return the launch emissions columns of `emissions.py`.
+
+    Returns
+    -------
+    results : DataFrame
+        One row per input row with the columns of `uq_results.csv`,
+        indexed like the input. When a cache is used, the hits and
+        misses of this call are stored in `results.attrs["cache"]`.
+    """
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+
+    results = {"constellation": df["constellation"].to_numpy()}
+    results.update(evaluate_columns(df, cache, cash_flow_years))
+    if emissions:
+        results.update(emission_columns(df))
+    for column in PASSTHROUGH_COLUMNS:
+        results[column] = df[column].to_numpy()
+
+    results = pd.DataFrame(results, index = df.index)
+    if cache is not None:
+        results.attrs["cache"] = {"hits": cache.hits - hits, "misses": cache.misses - misses}
+
+    return results
+
+
+def evaluate_cached(df, cash_flow_years = None, emissions = False):
+    """
+    Evaluate a parameter table through this process's `RADIO_CACHE`.
+
+    """
+    return evaluate(df, RADIO_CACHE, cash_flow_years, emissions)
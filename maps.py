@@ -0,0 +1,240 @@
+"""
+Regional map rendering for the saleos results.
+
+Every map is described by a spec: constellation, metric, bins, labels,
+colormap and title. `render_batch` renders a whole table of specs,
+loading and merging each constellation's data once, reusing one figure
+per worker and spreading constellations over a process pool. Basemaps
+can be read from a local tile store instead of the tile provider.
+
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+import contextily as ctx
+from boundaries import regional_shapes
+from tiles import BASEMAP, TileServer, TileStore
+
+CONSTELLATIONS = ['Starlink', 'OneWeb', 'Kuiper']
+
+METRIC_SPECS = {
+    'monthly_traffic_GB': {
+        'bins': [-1, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 100000],
+        'labels': [
+            '<1 $\\mathregular{GB}$',
+            '1 - 2.5 $\\mathregular{GB}$',
+            '2.5 - 5 $\\mathregular{GB}$',
+            '5 - 10 $\\mathregular{GB}$',
+            '10 - 25 $\\mathregular{GB}$',
+            '25 - 50 $\\mathregular{GB}$',
+            '50 - 100 $\\mathregular{GB}$',
+            '100 - 250 $\\mathregular{GB}$',
+            '250 - 500 $\\mathregular{GB}$',
+            '500 - 1000 $\\mathregular{GB}$',
+            '>1000 $\\mathregular{GB}$',
+        ],
+        'cmap': 'YlOrBr',
+        'title': 'Monthly traffic per User for  {}',
+    },
+    'pop_density': {
+        'bins': [-1, 20, 43, 68, 109, 110, 120, 150, 250, 500, 820000],
+        'labels': [
+            '<20 Mbps/user',
+            '20 - 43 $\\mathregular{km^2}$',
+            '43 - 68 $\\mathregular{km^2}$',
+            '68 - 109 $\\mathregular{km^2}$',
+            '109 - 110 $\\mathregular{km^2}$',
+            '110 - 120 $\\mathregular{km^2}$',
+            '120 - 150 $\\mathregular{km^2}$',
+            '150 - 250 $\\mathregular{km^2}$',
+            '250 - 500 $\\mathregular{km^2}$',
+            '>500 $\\mathregular{km^2}$',
+        ],
+        'cmap': 'YlGnBu',
+        'title': 'Population density  {}',
+    },
+    'capacity_user_mbps': {
+        'bins': [-1, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 100, 100000],
+        'labels': [
+            '<0.1 Mbps/user',
+            '0.1 - 0.25 Mbps/user',
+            '0.25 - 0.5 Mbps/user',
+            '0.5 - 1 Mbps/user',
+            '1 - 2.5 Mbps/user',
+            '2.5 - 5 Mbps/user',
+            '5 - 10 Mbps/user',
+            '10 - 25 Mbps/user',
+            '25 - 100 Mbps/user',
+            '>100 Mbps/user',
+        ],
+        'cmap': 'YlGnBu',
+        'title': 'Capacity per User for  {}',
+    },
+}
+
+
+def batch_specs(constellations = CONSTELLATIONS, metrics = None):
+    """
+    Build the spec table of every constellation x metric map.
+
+    Parameters
+    ----------
+    constellations : list
+        Constellation names.
+    metrics : list
+        Metrics of `METRIC_SPECS`, all of them by default.
+
+    Returns
+    -------
+    specs : DataFrame
+        One row per map with constellation, metric, bins, labels, cmap
+        and title columns.
+    """
+    metrics = list(METRIC_SPECS) if metrics is None else metrics
+
+    return pd.DataFrame([dict(constellation = constellation, metric = metric, **METRIC_SPECS[metric])
+                         for constellation in constellations for metric in metrics])
+
+
+def draw_map(fig, ax, regions, constellation, metric, bins, labels, cmap, title, source = BASEMAP):
+    """
+    Draw one binned regional map onto an existing figure and axes.
+
+    Parameters
+    ----------
+    fig : Figure
+        Figure holding `ax`. Its figure legends are replaced.
+    ax : Axes
+        Axes to draw on, cleared first.
+    regions : GeoDataFrame
+        Regions with geometry and a `metric` column.
+    constellation : string
+        Constellation name, formatted into `title`.
+    metric : string
+        Column to map.
+    bins, labels : list
+        Bin edges and their labels, as for pd.cut.
+    cmap : string
+        Matplotlib colormap name.
+    title : string
+        Map title, with a {} placeholder for the constellation.
+    source : TileProvider
+        Basemap tile provider.
+    """
+    ax.clear()
+    for legend in list(fig.legends):
+        legend.remove()
+
+    regions = regions.copy()
+    regions['bin'] = pd.cut(regions[metric], bins = bins, labels = labels)
+
+    regions.plot(column = 'bin', ax = ax, cmap = cmap, linewidth = 0.2,
+                 legend = True, edgecolor = 'grey')
+
+    handles, legend_labels = ax.get_legend_handles_labels()
+    fig.legend(handles[::-1], legend_labels[::-1])
+
+    ctx.add_basemap(ax, crs = regions.crs, source = source)
+
+    ax.set_title(title.format(constellation), fontsize = 14)
+    fig.tight_layout()
+
+
+def load_metrics(data_process, constellation, metrics):
+    """
+    Load and round the mapped metrics of one constellation.
+
+    """
+    path = os.path.join(data_process, '{}_final_final.csv'.format(constellation))
+    data = pd.read_csv(path, usecols = ['GID_1'] + list(metrics))
+    data[list(metrics)] = data[list(metrics)].round()
+
+    return data
+
+
+def render_constellation(constellation, specs, data_process, data_geo, vis, tiles = None, offline = False):
+    """
+    Render every map of one constellation on a single reused figure.
+
+    The regions and the constellation's results are loaded and merged
+    once for all of its metrics. With `tiles`, basemaps are served from
+    that tile store by a local server for the duration of the call.
+
+    Returns
+    -------
+    paths : list
+        Paths of the figures written.
+    """
+    metrics = list(dict.fromkeys(spec['metric'] for spec in specs))
+
+    regions = regional_shapes(data_geo, level = 2, geoparquet = True)
+    regions = regions.merge(load_metrics(data_process, constellation, metrics), on = 'GID_1')
+    regions.reset_index(drop = True, inplace = True)
+
+    server = None
+    source = BASEMAP
+    if tiles is not None:
+        server = TileServer(TileStore(tiles), BASEMAP, offline)
+        server.start()
+        source = server.provider
+
+    sns.set(font_scale = 0.9)
+    fig, ax = plt.subplots(1, 1, figsize = (10, 10))
+
+    paths = []
+    try:
+        for spec in specs:
+            draw_map(fig, ax, regions, constellation, spec['metric'], spec['bins'],
+                     spec['labels'], spec['cmap'], spec['title'], source)
+            path = os.path.join(vis, '{}_{}.png'.format(constellation, spec['metric']))
+            fig.savefig(path)
+            paths.append(path)
+    finally:
+        plt.close(fig)
+        if server is not None:
+            server.stop()
+
+    return paths
+
+
+def render_batch(specs, data_process, data_geo, vis, workers = 1, tiles = None, offline = False):
+    """
+    Render a table of map specs.
+
+    Parameters
+    ----------
+    specs : DataFrame
+        Spec table, e.g. from `batch_specs`.
+    data_process : string
+        Folder of the <constellation>_final_final.csv files.
+    data_geo : string
+        Folder of the boundary shapefiles.
+    vis : string
+        Output folder of the figures.
+    workers : int
+        Number of worker processes, one constellation per task.
+    tiles : string
+        Folder of a local tile store to read basemaps from, see tiles.py.
+    offline : bool
+        Never fetch tiles missing from `tiles`, leave them blank instead.
+
+    Returns
+    -------
+    paths : list
+        Paths of the figures written.
+    """
+    os.makedirs(vis, exist_ok = True)
+
+    tasks = [(constellation, group.to_dict('records'), data_process, data_geo, vis,
+              tiles, offline)
+             for constellation, group in specs.groupby('constellation', sort = False)]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            results = list(pool.map(render_constellation, *zip(*tasks)))
+    else:
+        results = [render_constellation(*task) for task in tasks]
+
+    return [path for paths in results for path in paths]
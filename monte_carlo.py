@@ -0,0 +1,142 @@
+"""
+Monte Carlo uncertainty mode for the saleos simulation.
+
+Each constellation's `iterations`, `seed_value`, `mu` and `sigma` define
+normally distributed perturbations of the link losses. Draws for a
+constellation are laid out as an (iterations x scenarios) array and
+pushed through the link budget in one broadcast call.
+
+"""
+import zlib
+import numpy as np
+import pandas as pd
+import link_budget as lb
+
+# Loss columns perturbed by N(mu, sigma) draws, in dB.
+PERTURBED_COLUMNS = ("earth_atmospheric_losses_dB", "all_other_losses_dB")
+
+# Scenario rows share one random stream per block of this many rows.
+BLOCK_SIZE = 4096
+
+DISTRIBUTION_COLUMNS = ["iterations", "seed_value", "mu", "sigma"]
+
+RESULT_COLUMNS = (["constellation", "iteration"] + lb.CAPACITY_COLUMNS + ["cost_model"]
+                  + lb.PASSTHROUGH_COLUMNS)
+
+
+def stream_key(constellation, column):
+    """
+    Stable integer key of the random stream of a constellation and column.
+
+    """
+    return zlib.crc32("{}:{}".format(constellation, column).encode())
+
+
+def standard_normal(seed, key, rows, iterations, block_size = BLOCK_SIZE):
+    """
+    Draw standard normal values for a set of scenario rows.
+
+    Rows are grouped into fixed blocks of `block_size` and each block has
+    its own generator seeded by (seed, key, block). The draws for a row
+    therefore depend only on the seed, the key and the row number, not on
+    how the table was chunked or sharded.
+
+    Parameters
+    ----------
+    seed : int
+        Seed value of the constellation.
+    key : int
+        Stream key, see `stream_key`.
+    rows : array
+        Global row numbers of the scenarios.
+    iterations : int
+        Number of draws per scenario.
+    block_size : int
+        Number of rows sharing one generator.
+
+    Returns
+    -------
+    draws : array
+        Array of shape (iterations, len(rows)).
+    """
+    rows = np.asarray(rows, dtype = np.int64)
+    blocks, position = np.unique(rows // block_size, return_inverse = True)
+
+    draws = np.empty((iterations, len(blocks) * block_size))
+    for i, block in enumerate(blocks):
+        generator = np.random.default_rng([int(seed), int(key), int(block)])
+        draws[:, i * block_size:(i + 1) * block_size] = generator.standard_normal((iterations, block_size))
+
+    return draws[:, position.ravel() * block_size + rows % block_size]
+
+
+def perturbed_columns(df, columns = PERTURBED_COLUMNS):
+    """
+    Build the broadcastable input columns of one constellation's draws.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Parameter rows of a single constellation, indexed by row number.
+    columns : tuple
+        Loss columns to perturb.
+
+    Returns
+    -------
+    inputs : dict
+        Column name to array. Perturbed columns have shape
+        (iterations, scenarios), all others (1, scenarios).
+    """
+    first = df.iloc[0]
+    iterations = int(first["iterations"])
+
+    inputs = {column: df[column].to_numpy()[np.newaxis, :] for column in df.columns}
+
+    for column in columns:
+        draws = standard_normal(first["seed_value"], stream_key(first["constellation"], column),
+                                df.index, iterations)
+        loss = inputs[column] + first["mu"] + first["sigma"] * draws
+        inputs[column] = np.maximum(loss, 0)
+
+    return inputs
+
+
+def evaluate(df, columns = PERTURBED_COLUMNS):
+    """
+    Evaluate every Monte Carlo draw of a parameter table.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Parameter table with the columns written by `uq_inputs.py`,
+        indexed by row number.
+    columns : tuple
+        Loss columns to perturb.
+
+    Returns
+    -------
+    results : DataFrame
+        One row per (scenario, iteration) with the columns of
+        `uq_results.csv` plus `iteration`, indexed by scenario row.
+    """
+    output = []
+
+    for _, group in df.groupby(["constellation"] + DISTRIBUTION_COLUMNS, sort = False):
+
+        inputs = perturbed_columns(group, columns)
+        iterations = int(group["iterations"].iloc[0])
+        shape = (iterations, len(group))
+
+        results = {"constellation": np.repeat(group["constellation"].to_numpy(), iterations),
+                   "iteration": np.tile(np.arange(iterations), len(group))}
+        for column, values in lb.evaluate_columns(inputs).items():
+            results[column] = np.broadcast_to(values, shape).T.ravel()
+        for column in lb.PASSTHROUGH_COLUMNS:
+            results[column] = np.repeat(group[column].to_numpy(), iterations)
+
+        output.append(pd.DataFrame(results, index = np.repeat(group.index.to_numpy(), iterations)))
+
+    if not output:
+        return pd.DataFrame(columns = RESULT_COLUMNS, index = df.index[:0])
+
+    return pd.concat(output).sort_index(kind = "stable")
@@ -0,0 +1,268 @@
+"""
+Stage timing for the saleos pipeline.
+
+`stage` and `timed` time a block or a function into the profiler active
+in the process, and do nothing while none is. `instrument` wraps the
+functions of a module, e.g. the link budget chain, only once profiling
+is requested, so unprofiled runs pay nothing. Worker processes profile
+their own calls and hand the records back with their results, where
+the runner merges them into one report and a Chrome trace file that
+Perfetto or chrome://tracing open.
+
+"""
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Link budget functions timed by `--profile`.
+LINK_BUDGET_FUNCTIONS = [
+    "path_loss", "antenna_gain", "total_losses", "eirp", "power_received_user", "noise_power",
+    "signal_to_noise_ratio", "spectral_efficiency", "channel_capacity", "satellite_capacity",
+    "constellation_capacity", "capacity_area", "capacity_columns", "cost_model", "cost_cash_flows",
+    "evaluate_columns",
+]
+
+PROFILER = None
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB, None if unknown.
+
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class Profiler:
+    """
+    Wall and CPU time, call counts and peak memory per stage.
+
+    Stages are recorded as trace events. Functions timed through `timed`
+    are only aggregated, since they may run once per row.
+    """
+    def __init__(self):
+
+        self.records = {}
+        self.events = []
+
+    def add(self, name, wall, cpu, calls = 1, rss = None):
+        """
+        Add timings to the record of a stage or function.
+
+        """
+        record = self.records.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": None})
+        record["calls"] += calls
+        record["wall_s"] += wall
+        record["cpu_s"] += cpu
+        if rss is not None:
+            record["peak_rss_mb"] = max(rss, record["peak_rss_mb"] or 0)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Time a block as one call of a stage.
+
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            end, cpu = time.perf_counter(), time.process_time() - cpu
+            rss = peak_rss_mb()
+            self.add(name, end - wall, cpu, rss = rss)
+            self.events.append({"name": name, "ph": "X", "pid": os.getpid(), "tid": 0,
+                                "ts": wall * 1e6, "dur": (end - wall) * 1e6,
+                                "args": {"cpu_s": cpu, "peak_rss_mb": rss}})
+
+    def merge(self, profile):
+        """
+        Merge the records and events of another profiler, e.g. a worker's.
+
+        """
+        for name, record in profile["records"].items():
+            self.add(name, record["wall_s"], record["cpu_s"], record["calls"], record["peak_rss_mb"])
+        self.events.extend(profile["events"])
+
+    def profile(self):
+        """
+        Records and events, in the form `merge` takes.
+
+        """
+        return {"records": self.records, "events": self.events}
+
+    def report(self):
+        """
+        Records as a table, slowest first.
+
+        """
+        report = pd.DataFrame.from_dict(self.records, orient = "index").rename_axis("stage")
+        if len(report):
+            report = report.sort_values("wall_s", ascending = False)
+
+        return report
+
+    def write_trace(self, path):
+        """
+        Write the stage events and records as a Chrome trace file.
+
+        """
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms",
+                       "otherData": {"records": self.records}}, f)
+
+
+def start():
+    """
+    Make a new profiler the active one of this process.
+
+    """
+    global PROFILER
+    PROFILER = Profiler()
+
+    return PROFILER
+
+
+def stop():
+    """
+    Deactivate and return the active profiler.
+
+    """
+    global PROFILER
+    profiler, PROFILER = PROFILER, None
+
+    return profiler
+
+
+def stage(name):
+    """
+    Time a block into the active profiler, if any.
+
+    """
+    return PROFILER.stage(name) if PROFILER is not None else contextlib.nullcontext()
+
+
+def iterate(name, iterable):
+    """
+    Time each step of an iterator as a call of a stage.
+
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def merge(profile):
+    """
+    Merge profile records into the active profiler, if any.
+
+    """
+    if PROFILER is not None and profile:
+        PROFILER.merge(profile)
+
+
+def timed(name):
+    """
+    Decorator aggregating the calls of a function into the active profiler.
+
+    """
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if PROFILER is None:
+                return function(*args, **kwargs)
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                PROFILER.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(module, names = LINK_BUDGET_FUNCTIONS):
+    """
+    Replace functions of a module by timed versions, once per process.
+
+    Calls made through the module, including those between its own
+    functions, are then timed as <module>.<function>.
+
+    """
+    for name in names:
+        function = getattr(module, name)
+        if not getattr(function, "timed", False):
+            function = timed("{}.{}".format(module.__name__, name))(function)
+            function.timed = True
+            setattr(module, name, function)
+
+
+class Profiled:
+    """
+    Evaluate function that profiles itself wherever it runs.
+
+    Each call runs under a fresh profiler with the link budget functions
+    instrumented, and stores its records in `results.attrs["profile"]`
+    for the caller to merge. Being a plain class it pickles to worker
+    processes.
+
+    Parameters
+    ----------
+    evaluate : function
+        Function mapping a parameter chunk to its results.
+    """
+    def __init__(self, evaluate):
+
+        self.evaluate = evaluate
+
+    def __call__(self, df):
+
+        global PROFILER
+        import link_budget
+        instrument(link_budget)
+
+        previous, PROFILER = PROFILER, Profiler()
+        try:
+            with PROFILER.stage("evaluate"):
+                results = self.evaluate(df)
+            results.attrs["profile"] = PROFILER.profile()
+        finally:
+            PROFILER = previous
+
+        return results
+
+
+@contextlib.contextmanager
+def cprofile(path):
+    """
+    Run a block under cProfile and dump the stats to `path` for pstats or snakeviz.
+
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,231 @@
+"""
+Registry of constellation parameters.
+
+Constellations are held as a NumPy record array with one typed field per
+entry of `inputs.parameters`, validated once when the registry is built.
+More constellations, or new values for existing ones, can be loaded from
+TOML or JSON files laid out like `inputs.parameters`: one table per
+constellation key, e.g.
+
+    [tele_sat]
+    name = "Telesat"
+    number_of_satellites = 298
+    ...
+
+A new constellation needs every field. A table for an existing key only
+needs the fields it changes, e.g.
+
+    [kuiper]
+    ground_station_cost = 50000000
+
+"""
+import json
+import os
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# Fields of a constellation record, as (name, dtype) or (name, dtype, shape).
+FIELDS = [
+    ("key", "U32"),
+    ("name", "U32"),
+    ("number_of_satellites", "i8"),
+    ("iterations", "i8"),
+    ("seed_value", "i8"),
+    ("mu", "f8"),
+    ("sigma", "f8"),
+    ("total_area_earth_km_sq", "f8"),
+    ("total_area_kenya_km_sq", "f8"),
+    ("altitude_km", "f8"),
+    ("dl_frequency", "f8"),
+    ("dl_bandwidth", "f8"),
+    ("speed_of_light", "f8"),
+    ("antenna_diameter", "f8"),
+    ("antenna_efficiency", "f8"),
+    ("power", "f8"),
+    ("receiver_gain", "f8"),
+    ("earth_atmospheric_losses", "f8"),
+    ("all_other_losses", "f8"),
+    ("number_of_channels", "i8"),
+    ("overbooking_factor", "i8"),
+    ("polarization", "i8"),
+    ("monthly_traffic_GB", "f8"),
+    ("percent_of_traffic", "f8"),
+    ("adoption_rate", "f8"),
+    ("subscribers", "i8", (3,)),
+    ("fuel_mass", "f8"),
+    ("fuel_mass_1", "f8"),
+    ("fuel_mass_2", "f8"),
+    ("fuel_mass_3", "f8"),
+    ("number_of_missions", "i8"),
+    ("satellite_manufacturing", "f8"),
+    ("satellite_launch_cost", "f8"),
+    ("ground_station_cost", "f8"),
+    ("spectrum_cost", "f8"),
+    ("regulation_fees", "f8"),
+    ("digital_infrastructure_cost", "f8"),
+    ("ground_station_energy", "f8"),
+    ("subscriber_acquisition", "f8"),
+    ("staff_costs", "f8"),
+    ("research_development", "f8"),
+    ("maintenance", "f8"),
+    ("discount_rate", "f8"),
+    ("assessment_period", "i8"),
+]
+
+DTYPE = np.dtype(FIELDS)
+
+# Numeric fields must be finite. Counts, rates, areas, masses and costs
+# must also be non-negative, while dB values and the loss perturbation
+# mean `mu` may take either sign.
+NON_NEGATIVE = [
+    "number_of_satellites", "iterations", "seed_value", "sigma", "total_area_earth_km_sq",
+    "total_area_kenya_km_sq", "altitude_km", "dl_frequency", "dl_bandwidth", "speed_of_light",
+    "antenna_diameter", "antenna_efficiency", "number_of_channels", "overbooking_factor",
+    "polarization", "monthly_traffic_GB", "percent_of_traffic", "adoption_rate", "subscribers",
+    "fuel_mass", "fuel_mass_1", "fuel_mass_2", "fuel_mass_3", "number_of_missions",
+    "satellite_manufacturing", "satellite_launch_cost", "ground_station_cost", "spectrum_cost",
+    "regulation_fees", "digital_infrastructure_cost", "ground_station_energy", "subscriber_acquisition",
+    "staff_costs", "research_development", "maintenance", "discount_rate", "assessment_period",
+]
+
+# These must also be positive, and fractions at most 1.
+POSITIVE = [
+    "number_of_satellites", "iterations", "total_area_earth_km_sq", "total_area_kenya_km_sq",
+    "altitude_km", "dl_frequency", "dl_bandwidth", "speed_of_light", "antenna_diameter",
+    "antenna_efficiency", "number_of_channels", "overbooking_factor", "polarization",
+    "assessment_period",
+]
+
+FRACTIONS = ["antenna_efficiency", "adoption_rate"]
+
+
+def validate(key, entry):
+    """
+    Check a constellation entry and convert it to a record tuple.
+
+    Parameters
+    ----------
+    key : string
+        Constellation key, e.g. 'starlink'.
+    entry : dict
+        Field name to value, as in `inputs.parameters`.
+
+    Returns
+    -------
+    record : tuple
+        Field values in `DTYPE` order.
+    """
+    names = DTYPE.names[1:]
+    missing = [name for name in names if name not in entry]
+    unknown = [name for name in entry if name not in names]
+    if missing or unknown:
+        raise ValueError("constellation {!r}: missing fields {}, unknown fields {}".format(key, missing, unknown))
+
+    record = [key]
+    for name in names:
+        field = DTYPE[name]
+        value = entry[name]
+
+        if field.kind == "U":
+            if not isinstance(value, str) or len(value) > field.itemsize // 4:
+                raise ValueError("constellation {!r}: {} must be a string of at most {} characters".format(
+                    key, name, field.itemsize // 4))
+            record.append(value)
+            continue
+
+        shape = field.shape if field.subdtype else ()
+        try:
+            array = np.asarray(value, dtype = float)
+        except (TypeError, ValueError):
+            raise ValueError("constellation {!r}: {} must be numeric, got {!r}".format(key, name, value))
+        if array.shape != shape:
+            raise ValueError("constellation {!r}: {} must have shape {}, got {}".format(key, name, shape, array.shape))
+        if not np.isfinite(array).all():
+            raise ValueError("constellation {!r}: {} must be finite".format(key, name))
+        if name in NON_NEGATIVE and (array < 0).any():
+            raise ValueError("constellation {!r}: {} must be non-negative".format(key, name))
+        if field.base.kind == "i" and (array != np.round(array)).any():
+            raise ValueError("constellation {!r}: {} must be a whole number".format(key, name))
+        if name in POSITIVE and (array <= 0).any():
+            raise ValueError("constellation {!r}: {} must be positive".format(key, name))
+        if name in FRACTIONS and (array > 1).any():
+            raise ValueError("constellation {!r}: {} must be at most 1".format(key, name))
+        record.append(array.astype(field.base).tolist())
+
+    if record[names.index("percent_of_traffic") + 1] > 100:
+        raise ValueError("constellation {!r}: percent_of_traffic must be at most 100".format(key))
+    if np.any(np.diff(record[names.index("subscribers") + 1]) < 0):
+        raise ValueError("constellation {!r}: subscribers must be ordered low, baseline, high".format(key))
+
+    return tuple(record)
+
+
+def records(params):
+    """
+    Constellation record array of a parameters dict.
+
+    Record arrays are returned as they are, so functions can take either.
+
+    """
+    if isinstance(params, np.ndarray):
+        return params
+
+    constellations = np.array([validate(key, entry) for key, entry in params.items()], dtype = DTYPE)
+    names, counts = np.unique(constellations["name"], return_counts = True)
+    if (counts > 1).any():
+        raise ValueError("constellation names must be unique, repeated: {}".format(names[counts > 1].tolist()))
+
+    return constellations.view(np.recarray)
+
+
+def read_file(path):
+    """
+    Constellation entries of a TOML or JSON file, as a dict.
+
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".json":
+        with open(path) as f:
+            return json.load(f)
+
+    if extension == ".toml":
+        if tomllib is None:
+            raise ImportError("tomli is required to read TOML files before Python 3.11")
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+
+    raise ValueError("constellation files must be .toml or .json, got {}".format(path))
+
+
+def load(paths = (), base = None):
+    """
+    Build the registry from constellation files.
+
+    Parameters
+    ----------
+    paths : list
+        TOML or JSON files, read in order.
+    base : dict
+        Entries the files add to, e.g. `inputs.parameters`. The fields of
+        a file entry replace those of a base or earlier entry with the
+        same key, and its other fields are kept.
+
+    Returns
+    -------
+    constellations : recarray
+        One validated record per constellation, with `DTYPE` fields.
+    """
+    entries = {key: dict(entry) for key, entry in (base or {}).items()}
+    for path in paths or ():
+        for key, entry in read_file(path).items():
+            entries.setdefault(key, {}).update(entry)
+
+    return records(entries)
@@ -0,0 +1,281 @@
+"""
+Persistent store of model results keyed by input fingerprints.
+
+Every parameter row gets a 64-bit fingerprint hashing its input values
+together with a version of the evaluation: the source of the model
+modules and the evaluate function with its options. Results are kept
+in Feather segments indexed by fingerprint, so a re-run only evaluates
+rows whose inputs, or the model, changed since they were stored.
+
+"""
+import functools
+import glob
+import hashlib
+import inspect
+import os
+import sys
+import numpy as np
+import pandas as pd
+from table_io import read_table, write_table
+
+# Modules whose source is part of every fingerprint. `inputs` holds the
+# spectral efficiency table, which is not in the parameter rows.
+MODEL_MODULES = ["inputs", "link_budget", "monte_carlo", "emissions"]
+
+SEGMENT_SIZE = 500000
+
+
+def _unwrap(evaluate):
+    """
+    Function and options behind an evaluate callable.
+
+    Partials contribute their keywords, and wrappers holding the wrapped
+    function as `evaluate`, like `profiling.Profiled`, are looked through.
+
+    """
+    options = []
+    while True:
+        if isinstance(evaluate, functools.partial):
+            options.append(repr(evaluate.args) + repr(sorted(evaluate.keywords.items())))
+            evaluate = evaluate.func
+        elif hasattr(evaluate, "evaluate"):
+            evaluate = evaluate.evaluate
+        else:
+            return evaluate, options
+
+
+def code_version(evaluate, modules = MODEL_MODULES):
+    """
+    Digest of the model source and of the evaluate function and options.
+
+    Parameters
+    ----------
+    evaluate : function
+        Function mapping a parameter chunk to its results.
+    modules : list
+        Names of the modules whose source versions the model.
+
+    Returns
+    -------
+    version : string
+        Hex digest, different whenever the model or the evaluation change.
+    """
+    function, options = _unwrap(evaluate)
+    digest = hashlib.sha256()
+
+    for name in sorted(set(modules) | {function.__module__}):
+        __import__(name)
+        digest.update(name.encode())
+        digest.update(inspect.getsource(sys.modules[name]).encode())
+    digest.update("{}.{}".format(function.__module__, function.__qualname__).encode())
+    for option in options:
+        digest.update(option.encode())
+
+    return digest.hexdigest()
+
+
+def fingerprints(df, version):
+    """
+    Fingerprint every row of a parameter table.
+
+    Columns are hashed in name order. Numbers are hashed as floats and
+    labels as strings, so a row hashes the same whether it was read from
+    CSV, Parquet or Feather, or generated.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Parameter rows.
+    version : string
+        Evaluation version from `code_version`.
+
+    Returns
+    -------
+    fingerprints : array
+        uint64 fingerprint of each row.
+    """
+    columns = sorted(df.columns)
+    values = pd.DataFrame({column: df[column].to_numpy(dtype = float)
+                           if pd.api.types.is_numeric_dtype(df[column]) else df[column].astype(str).to_numpy()
+                           for column in columns})
+    key = hashlib.sha256((version + "\0".join(columns)).encode()).hexdigest()[:16]
+
+    return pd.util.hash_pandas_object(values, index = False, hash_key = key).to_numpy()
+
+
+class ResultStore:
+    """
+    Results of evaluated parameter rows, keyed by fingerprint.
+
+    New results are buffered and written as Feather segments of at most
+    `segment_size` rows under `root`.
+
+    Parameters
+    ----------
+    root : string
+        Folder of the store.
+    segment_size : int
+        Rows buffered before a segment is written.
+    """
+    def __init__(self, root, segment_size = SEGMENT_SIZE):
+
+        os.makedirs(root, exist_ok = True)
+        self.root = root
+        self.segment_size = segment_size
+        self.buffer = []
+        self.buffered = 0
+        self.used = []
+        self.segments = {}
+        for path in sorted(glob.glob(os.path.join(root, "*.feather"))):
+            segment = int(os.path.basename(path).split(".")[0])
+            self.segments[segment] = read_table(self._stem(segment), "feather", columns = []).index.to_numpy()
+        self._index = None
+        self._segment = functools.lru_cache(maxsize = 2)(self._read_segment)
+
+    def __len__(self):
+
+        return sum(len(keys) for keys in self.segments.values())
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.flush()
+
+    def _stem(self, segment):
+        """
+        Path of a segment without extension.
+
+        """
+        return os.path.join(self.root, "{:06d}".format(segment))
+
+    def _read_segment(self, segment):
+        """
+        Results of a segment indexed by fingerprint.
+
+        """
+        return read_table(self._stem(segment), "feather")
+
+    @property
+    def index(self):
+        """
+        Segment of every stored fingerprint, as a Series.
+
+        """
+        if self._index is None:
+            keys = list(self.segments.values())
+            labels = [np.full(len(self.segments[segment]), segment) for segment in self.segments]
+            self._index = pd.Series(np.concatenate(labels) if labels else np.empty(0, dtype = int),
+                                    index = pd.Index(np.concatenate(keys) if keys else np.empty(0, dtype = np.uint64)))
+
+        return self._index
+
+    def contains(self, keys):
+        """
+        Boolean mask of the fingerprints held in stored segments.
+
+        """
+        return self.index.index.get_indexer(keys) >= 0
+
+    def get(self, keys):
+        """
+        Stored results of fingerprints, all of which must be held.
+
+        Returns
+        -------
+        results : DataFrame
+            One row per fingerprint, in the order given, indexed by
+            position.
+        """
+        segments = self.index.to_numpy()[self.index.index.get_indexer(keys)]
+        parts = []
+
+        for segment in np.unique(segments):
+            mask = segments == segment
+            part = self._segment(segment).loc[keys[mask]]
+            part.index = np.flatnonzero(mask)
+            parts.append(part)
+
+        if not parts:
+            return pd.DataFrame(index = pd.RangeIndex(0))
+
+        return pd.concat(parts).sort_index()
+
+    def mark(self, keys):
+        """
+        Record fingerprints as used by the current run, see `compact`.
+
+        """
+        self.used.append(np.asarray(keys, dtype = np.uint64))
+
+    def put(self, keys, results):
+        """
+        Buffer the results of newly evaluated fingerprints.
+
+        """
+        results = results.set_axis(pd.Index(keys, dtype = np.uint64), axis = 0)
+        results.attrs = {}
+        self.buffer.append(results)
+        self.buffered += len(results)
+        if self.buffered >= self.segment_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered results as a new segment.
+
+        Fingerprints already stored, or buffered twice, are written once.
+
+        """
+        if not self.buffer:
+            return
+
+        results = pd.concat(self.buffer)
+        results = results[~results.index.duplicated()]
+        results = results[~self.contains(results.index.to_numpy())]
+        self.buffer, self.buffered = [], 0
+        if not len(results):
+            return
+
+        segment = max(self.segments, default = -1) + 1
+        write_table(results, self._stem(segment), "feather")
+        self.segments[segment] = results.index.to_numpy()
+        self._index = None
+
+    def compact(self, keep = None):
+        """
+        Rewrite the store with only the results of the given fingerprints.
+
+        By default, those marked as used by the current run are kept.
+
+        Returns
+        -------
+        removed : int
+            Number of results dropped.
+        """
+        self.flush()
+        before = len(self)
+        if keep is None:
+            keep = np.concatenate(self.used) if self.used else np.empty(0, dtype = np.uint64)
+        keep = pd.Index(np.asarray(keep, dtype = np.uint64)).unique()
+        keep = keep[self.contains(keep.to_numpy())].to_numpy()
+
+        old = self.segments
+        segment = max(old, default = -1) + 1
+        segments = {}
+        for start in range(0, len(keep), self.segment_size):
+            keys = keep[start:start + self.segment_size]
+            write_table(self.get(keys).set_axis(pd.Index(keys, dtype = np.uint64), axis = 0),
+                        self._stem(segment), "feather")
+            segments[segment] = keys
+            segment += 1
+
+        self.segments = segments
+        self._index = None
+        self._segment.cache_clear()
+        for segment in old:
+            os.remove(self._stem(segment) + ".feather")
+
+        return before - len(self)
@@ -1,78 +1,471 @@
-from __future__ import division
-import configparser
-import os
-import math
-import time
-from numpy import savez_compressed
-import pandas as pd
-import link_budget as lb
-from inputs import lut
-from tqdm import tqdm
-
-path = "C:/Users/bmwan/Desktop/5.2/Link Budget/results/"
-df = pd.read_csv(path + "uq_parameters.csv")
-uq_dict = df.to_dict('records')
-
-uq_results = []
-
-for item in tqdm(uq_dict, desc = "Processing uncertainity results"):
-
-    constellation = item["constellation"]
-
-    number_of_satellites = item["number_of_satellites"]
-
-    path_loss = lb.path_loss(item["altitude_km"], item["dl_frequency_Hz"])
-    
-    antenna_gain = lb.antenna_gain(item["antenna_efficiency"], item["antenna_diameter_m"], item["dl_frequency_Hz"])
-
-    total_losses = lb.total_losses(item["earth_atmospheric_losses_dB"], item["all_other_losses_dB"]) 
-
-    cnr_scenario = item["cnr_scenario"]
-
-    eirp = lb.eirp(item["power_dBw"], antenna_gain)
-    
-    power_received_user = lb.power_received_user(eirp, path_loss, total_losses, item["receiver_gain_dB"] )
-
-    noise_power = lb.noise_power(290, item["dl_bandwidth_Hz"]) 
-
-    signal_to_noise_ratio = lb.signal_to_noise_ratio(power_received_user, noise_power)
-
-    spectral_efficiency = lb.spectral_efficiency(signal_to_noise_ratio)
-
-    channel_capacity = lb.channel_capacity(spectral_efficiency, item["dl_bandwidth_Hz"])
-
-    satellite_capacity = lb.satellite_capacity(spectral_efficiency, item["dl_bandwidth_Hz"], item["number_of_channels"], item["polarization"])
-
-    constellation_capacity = lb.constellation_capacity(satellite_capacity, item["number_of_satellites"])
-
-    capacity_area = lb.capacity_area(constellation_capacity, item["coverage_area_per_sat_sqkm"])
-
-    capex = item["capex_costs"]
-
-    capex_scenario = item["capex_scenario"]
-
-    total_opex  = item["opex_costs"]
-
-    opex_scenario = item["opex_scenario"]
-    
-    satellite_launch_cost = item["satellite_launch_cost"]
-
-    cost_scenario = item["cost_scenario"]
-    
-
-    cost_model = lb.cost_model(item["satellite_manufacturing"], item["satellite_launch_cost"], item["ground_station_cost"]
-                              ,item["spectrum_cost"], item["regulation_fees"], item["digital_infrastructure_cost"],
-                               item["ground_station_energy"], item["subscriber_acquisition"], item["staff_costs"], 
-                               item["research_development"], item["maintenance_costs"], item["discount_rate"], 
-                               item["assessment_period_year"])
-
-    uq_results.append({"constellation": constellation, "path_loss": path_loss, "antenna_gain": antenna_gain, 
-                    "total_losses": total_losses, "eirp": eirp, "power_received_user": power_received_user, "noise_power": noise_power, 
-                    "signal_to_noise_ratio":signal_to_noise_ratio, "spectral_efficiency":spectral_efficiency, "channel capacity":channel_capacity,
-                    "single_satellite_capacity_in_Gbps": satellite_capacity, "constelation_capacity":constellation_capacity, "capacity_area_GBps":capacity_area, "cost_model":cost_model, "cnr_scenario":cnr_scenario,
-                    "capex_costs":capex, "capex_scenario":capex_scenario, "opex_costs":total_opex, "opex_scenario":opex_scenario,
-                     "satellite_launch_cost":satellite_launch_cost, "cost_scenario": cost_scenario})
-                      
-df = pd.DataFrame.from_dict(uq_results)
-df.to_csv(path + "uq_results.csv")
-print ("Task Completed")
\ No newline at end of file
+from __future__ import division
+import argparse
+import hashlib
+import os
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import pandas as pd
+import link_budget as lb
+import monte_carlo as mc
+import profiling
+import registry
+import result_store
+from checkpoints import Checkpoint
+from cubes import SummaryCube
+from inputs import parameters
+from table_io import FORMATS, TableWriter, iter_table, table_path, write_table
+from uq_inputs import generate_scenarios
+from tqdm import tqdm
+
+path = "C:/Users/bmwan/Desktop/5.2/Link Budget/results/"
+
+CHUNK_SIZE = 50000
+
+
+def run_rows(df):
+    """
+    Evaluate the parameter table one row at a time.
+
+    Kept as a fallback for checking the vectorized engine.
+
+    """
+    uq_dict = df.to_dict('records')
+
+    uq_results = []
+
+    for item in tqdm(uq_dict, desc = "Processing uncertainity results"):
+
+        constellation = item["constellation"]
+
+        number_of_satellites = item["number_of_satellites"]
+
+        path_loss = lb.path_loss(item["altitude_km"], item["dl_frequency_Hz"])
+
+        antenna_gain = lb.antenna_gain(item["antenna_efficiency"], item["antenna_diameter_m"], item["dl_frequency_Hz"])
+
+        total_losses = lb.total_losses(item["earth_atmospheric_losses_dB"], item["all_other_losses_dB"])
+
+        cnr_scenario = item["cnr_scenario"]
+
+        eirp = lb.eirp(item["power_dBw"], antenna_gain)
+
+        power_received_user = lb.power_received_user(eirp, path_loss, total_losses, item["receiver_gain_dB"] )
+
+        noise_power = lb.noise_power(290, item["dl_bandwidth_Hz"])
+
+        signal_to_noise_ratio = lb.signal_to_noise_ratio(power_received_user, noise_power)
+
+        spectral_efficiency = lb.spectral_efficiency(signal_to_noise_ratio)
+
+        channel_capacity = lb.channel_capacity(spectral_efficiency, item["dl_bandwidth_Hz"])
+
+        satellite_capacity = lb.satellite_capacity(spectral_efficiency, item["dl_bandwidth_Hz"], item["number_of_channels"], item["polarization"])
+
+        constellation_capacity = lb.constellation_capacity(satellite_capacity, item["number_of_satellites"])
+
+        capacity_area = lb.capacity_area(constellation_capacity, item["coverage_area_per_sat_sqkm"])
+
+        capex = item["capex_costs"]
+
+        capex_scenario = item["capex_scenario"]
+
+        total_opex  = item["opex_costs"]
+
+        opex_scenario = item["opex_scenario"]
+
+        satellite_launch_cost = item["satellite_launch_cost"]
+
+        cost_scenario = item["cost_scenario"]
+
+
+        cost_model = lb.cost_model(item["satellite_manufacturing"], item["satellite_launch_cost"], item["ground_station_cost"]
+                                  ,item["spectrum_cost"], item["regulation_fees"], item["digital_infrastructure_cost"],
+                                   item["ground_station_energy"], item["subscriber_acquisition"], item["staff_costs"],
+                                   item["research_development"], item["maintenance_costs"], item["discount_rate"],
+                                   item["assessment_period_year"])
+
+        uq_results.append({"constellation": constellation, "path_loss": path_loss, "antenna_gain": antenna_gain,
+                        "total_losses": total_losses, "eirp": eirp, "power_received_user": power_received_user, "noise_power": noise_power,
+                        "signal_to_noise_ratio":signal_to_noise_ratio, "spectral_efficiency":spectral_efficiency, "channel capacity":channel_capacity,
+                        "single_satellite_capacity_in_Gbps": satellite_capacity, "constelation_capacity":constellation_capacity, "capacity_area_GBps":capacity_area, "cost_model":cost_model, "cnr_scenario":cnr_scenario,
+                        "capex_costs":capex, "capex_scenario":capex_scenario, "opex_costs":total_opex, "opex_scenario":opex_scenario,
+                         "satellite_launch_cost":satellite_launch_cost, "cost_scenario": cost_scenario})
+
+    return pd.DataFrame(uq_results, index = df.index)
+
+
+def shards(df, chunk_size = CHUNK_SIZE):
+    """
+    Split a parameter table by constellation and then by row range.
+
+    """
+    for _, group in df.groupby("constellation", sort = False):
+        for start in range(0, len(group), chunk_size):
+            yield group.iloc[start:start + chunk_size]
+
+
+def evaluate_chunks(chunks, evaluate = lb.evaluate, workers = 1):
+    """
+    Evaluate parameter chunks lazily, optionally on a process pool.
+
+    At most two chunks per worker are in flight at once, so memory stays
+    bounded by the chunk size however many chunks there are.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Parameter DataFrames indexed by row number.
+    evaluate : function
+        Module-level function mapping a parameter chunk to its results,
+        e.g. `link_budget.evaluate` or `monte_carlo.evaluate`.
+    workers : int
+        Number of worker processes, 1 runs in this process.
+
+    Yields
+    ------
+    results : DataFrame
+        Results of each chunk, in the order of the chunks.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield evaluate(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(evaluate, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def evaluate_shards(chunks, evaluate = lb.evaluate, workers = 1, shard_size = None):
+    """
+    Evaluate parameter chunks shard by shard, merging each chunk back in row order.
+
+    Every chunk is split by `shards`, so no task mixes constellations,
+    and the shards of all chunks share the pool of `evaluate_chunks`.
+    Draws are keyed by row number, so the merged results match a serial
+    run exactly.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Parameter DataFrames indexed by row number.
+    evaluate : function
+        Module-level function mapping a parameter shard to its results.
+    workers : int
+        Number of worker processes, 1 runs in this process.
+    shard_size : int
+        Maximum number of parameter rows per shard, None evaluates every
+        chunk as one task.
+
+    Yields
+    ------
+    results : DataFrame
+        Results of each chunk, in the order of the chunks, with the
+        summed link budget cache hits and misses of its shards.
+    """
+    if shard_size is None:
+        yield from evaluate_chunks(chunks, evaluate, workers)
+        return
+
+    counts = deque()
+
+    def split():
+        for chunk in chunks:
+            parts = list(shards(chunk, shard_size)) or [chunk]
+            counts.append(len(parts))
+            yield from parts
+
+    parts = []
+    for results in evaluate_chunks(split(), evaluate, workers):
+        profiling.merge(results.attrs.pop("profile", None))
+        parts.append(results)
+        if len(parts) < counts[0]:
+            continue
+
+        counts.popleft()
+        caches = [part.attrs["cache"] for part in parts if "cache" in part.attrs]
+        results = pd.concat(parts).sort_index(kind = "stable")
+        results.attrs = {}
+        if caches:
+            results.attrs["cache"] = {key: sum(cache[key] for cache in caches) for key in caches[0]}
+        parts = []
+        yield results
+
+
+def incremental_chunks(chunks, store, evaluate = lb.evaluate, workers = 1, shard_size = None):
+    """
+    Evaluate parameter chunks, reusing stored results of unchanged rows.
+
+    Rows are fingerprinted with `result_store.fingerprints`. Only rows
+    missing from the store are evaluated, and their results are added
+    to it. The evaluation must give one result row per parameter row.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Parameter DataFrames indexed by row number.
+    store : ResultStore
+        Store of earlier results.
+    evaluate : function
+        Module-level function mapping a parameter chunk to its results.
+    workers : int
+        Number of worker processes, 1 runs in this process.
+    shard_size : int
+        Maximum number of rows per shard of the evaluated rows, see
+        `evaluate_shards`.
+
+    Yields
+    ------
+    results : DataFrame
+        Results of each chunk, in the order of the chunks, with the
+        number of reused and evaluated rows in `results.attrs["store"]`.
+    """
+    version = result_store.code_version(evaluate)
+    pending = deque()
+
+    def misses():
+        for chunk in chunks:
+            keys = result_store.fingerprints(chunk, version)
+            store.mark(keys)
+            hit = store.contains(keys)
+            cached = store.get(keys[hit]).set_axis(chunk.index[hit], axis = 0) if hit.any() else None
+            pending.append((chunk.index, keys[~hit], cached))
+            yield chunk[~hit]
+
+    for results in evaluate_shards(misses(), evaluate, workers, shard_size):
+        index, keys, cached = pending.popleft()
+        store.put(keys, results)
+        attrs = dict(results.attrs)
+        if cached is not None:
+            results = pd.concat([cached, results]).loc[index] if len(results) else cached
+        results.attrs.update(attrs)
+        results.attrs["store"] = {"reused": len(index) - len(keys), "evaluated": len(keys)}
+        yield results
+
+
+def run(df, evaluate = lb.evaluate, workers = 1, chunk_size = CHUNK_SIZE):
+    """
+    Evaluate a parameter table shard by shard, optionally in parallel.
+
+    Monte Carlo draws are keyed by seed, constellation and row number (see
+    `monte_carlo.standard_normal`), so every shard has its own random
+    streams and the merged output matches a serial run exactly.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Parameter table indexed by row number.
+    evaluate : function
+        Module-level function mapping a parameter shard to its results.
+    workers : int
+        Number of worker processes, 1 runs in this process.
+    chunk_size : int
+        Maximum number of parameter rows per shard.
+
+    Returns
+    -------
+    results : DataFrame
+        Results in the original row order.
+    """
+    return pd.concat(list(evaluate_shards([df], evaluate, workers, chunk_size)))
+
+
+def stream(chunks, writer, evaluate = lb.evaluate, workers = 1, cube = None, store = None, checkpoint = None,
+           shard_size = None):
+    """
+    Evaluate parameter chunks and append their results to a table.
+
+    Neither the parameters nor the results are ever held in full, so
+    peak memory depends on the chunk size rather than the grid size.
+    With a checkpoint, chunks it already holds are skipped, new results
+    are saved to it as they complete, and the table is written from it
+    once every chunk is done.
+    Reading, writing and summarizing are timed into the active profiler,
+    with the records an evaluation stores in `attrs["profile"]`.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Parameter DataFrames in row order, e.g. from
+        `uq_inputs.generate_scenarios` or `table_io.iter_table`.
+    writer : TableWriter
+        Incremental writer of the results table.
+    evaluate : function
+        Module-level function mapping a parameter chunk to its results.
+    workers : int
+        Number of worker processes, 1 runs in this process.
+    cube : SummaryCube
+        Summary cube updated with every result chunk, if any.
+    store : ResultStore
+        Store of earlier results to reuse and extend, if any.
+    checkpoint : Checkpoint
+        Checkpoint of the sweep to resume and extend, if any.
+    shard_size : int
+        Split every chunk by constellation into shards of at most this
+        many rows, see `evaluate_shards`. None evaluates whole chunks.
+
+    Returns
+    -------
+    stats : dict
+        Number of result rows written and, when the evaluation uses a
+        link budget cache or a result store, its summed hits and misses
+        or reused and evaluated rows.
+    """
+    stats = {"rows": 0}
+    chunks = profiling.iterate("read", chunks)
+    if checkpoint is not None:
+        chunks = checkpoint.remaining(chunks)
+
+    def output(results):
+        with profiling.stage("write"):
+            writer.write(results)
+        if cube is not None:
+            with profiling.stage("summary"):
+                cube.update(results)
+        stats["rows"] += len(results)
+
+    if store is None:
+        evaluated = evaluate_shards(chunks, evaluate, workers, shard_size)
+    else:
+        evaluated = incremental_chunks(chunks, store, evaluate, workers, shard_size)
+
+    for results in evaluated:
+        profiling.merge(results.attrs.pop("profile", None))
+        for key, value in {**results.attrs.get("cache", {}), **results.attrs.get("store", {})}.items():
+            stats[key] = stats.get(key, 0) + value
+        if checkpoint is None:
+            output(results)
+        else:
+            with profiling.stage("checkpoint"):
+                checkpoint.save(results)
+
+    if checkpoint is not None:
+        for results in profiling.iterate("read", checkpoint.results()):
+            output(results)
+
+    return stats
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Run the capacity and cost model over uq_parameters")
+    parser.add_argument("--loop", action = "store_true",
+                        help = "evaluate row by row instead of in one vectorized pass")
+    parser.add_argument("--monte-carlo", action = "store_true",
+                        help = "evaluate every seeded loss draw of each scenario")
+    parser.add_argument("--cache", action = "store_true",
+                        help = "evaluate the radio chain once per unique combination of its inputs")
+    parser.add_argument("--cash-flows", action = "store_true",
+                        help = "add the discounted cost of every assessment year to the results")
+    parser.add_argument("--emissions", action = "store_true",
+                        help = "add the launch emissions of every scenario to the results")
+    parser.add_argument("--generate", action = "store_true",
+                        help = "generate scenarios from the constellation registry instead of reading uq_parameters")
+    parser.add_argument("--registry", nargs = "+", default = [], metavar = "FILE",
+                        help = "TOML or JSON constellation files adding to, or overriding, inputs.parameters")
+    parser.add_argument("--workers", type = int, default = 1,
+                        help = "number of worker processes")
+    parser.add_argument("--chunk-size", type = int, default = CHUNK_SIZE,
+                        help = "maximum number of parameter rows read at a time")
+    parser.add_argument("--shard-size", type = int, default = None,
+                        help = "split every chunk by constellation into tasks of at most this many rows")
+    parser.add_argument("--format", choices = list(FORMATS), default = "csv",
+                        help = "table format of uq_parameters and uq_results")
+    parser.add_argument("--export-csv", action = "store_true",
+                        help = "also write uq_results.csv for a columnar format")
+    parser.add_argument("--summary", action = "store_true",
+                        help = "also write the uq_summary cube of mean and sd per scenario level")
+    parser.add_argument("--profile", action = "store_true",
+                        help = "time every stage and link budget function, writing uq_profile.json")
+    parser.add_argument("--cprofile", metavar = "PATH", default = None,
+                        help = "also run this process under cProfile and dump its stats to PATH")
+    parser.add_argument("--incremental", action = "store_true",
+                        help = "only evaluate rows whose inputs or model changed since the last run")
+    parser.add_argument("--checkpoint", action = "store_true",
+                        help = "save every evaluated chunk to uq_checkpoint so the sweep can be resumed")
+    parser.add_argument("--resume", action = "store_true",
+                        help = "continue the checkpointed sweep in uq_checkpoint, skipping its finished chunks")
+    args = parser.parse_args()
+
+    if args.incremental and (args.monte_carlo or args.loop):
+        parser.error("--incremental needs one result row per parameter row, without --monte-carlo or --loop")
+    if args.emissions and (args.monte_carlo or args.loop):
+        parser.error("--emissions is evaluated with the vectorized engine, without --monte-carlo or --loop")
+    if (args.cache or args.cash_flows) and (args.monte_carlo or args.loop):
+        parser.error("--cache and --cash-flows apply to the vectorized engine, without --monte-carlo or --loop")
+
+    constellations = registry.load(args.registry, parameters)
+
+    if args.generate:
+        chunks = generate_scenarios(constellations, args.chunk_size)
+    else:
+        chunks = iter_table(path + "uq_parameters", args.format, args.chunk_size)
+
+    if args.loop:
+        evaluate = run_rows
+    elif args.monte_carlo:
+        evaluate = mc.evaluate
+    else:
+        evaluate = lb.evaluate_cached if args.cache else lb.evaluate
+        if args.cash_flows:
+            years = int(constellations["assessment_period"].max())
+            evaluate = partial(evaluate, cash_flow_years = years)
+        if args.emissions:
+            evaluate = partial(evaluate, emissions = True)
+
+    cube = SummaryCube() if args.summary else None
+    store = result_store.ResultStore(path + "uq_store") if args.incremental else None
+
+    checkpoint = None
+    if args.checkpoint or args.resume:
+        if args.generate:
+            source = {"generate": hashlib.sha256(constellations.tobytes()).hexdigest()}
+        else:
+            source = os.stat(table_path(path + "uq_parameters", args.format))
+            source = {"parameters": args.format, "size": source.st_size, "mtime": source.st_mtime}
+        signature = {**source, "chunk_size": args.chunk_size,
+                     "evaluate": result_store.code_version(evaluate)}
+        checkpoint = Checkpoint(path + "uq_checkpoint", signature, args.format, resume = args.resume)
+        if len(checkpoint):
+            print ("Resuming after {} finished chunks".format(len(checkpoint)))
+
+    if args.profile:
+        profiler = profiling.start()
+        evaluate = profiling.Profiled(evaluate)
+
+    with profiling.cprofile(args.cprofile) if args.cprofile else nullcontext():
+        with profiling.stage("total"):
+            with TableWriter(path + "uq_results", args.format, args.export_csv) as writer:
+                stats = stream(chunks, writer, evaluate, args.workers, cube, store, checkpoint, args.shard_size)
+
+            if cube is not None:
+                with profiling.stage("summary"):
+                    write_table(cube.to_frame(), path + "uq_summary", args.format)
+
+    if args.profile:
+        profiling.stop()
+        profiler.write_trace(path + "uq_profile.json")
+        print (profiler.report().to_string())
+
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    if store is not None:
+        store.flush()
+        # Drop results no longer used once they outnumber the live ones.
+        if len(store) > 2 * stats["rows"]:
+            store.compact()
+        print ("Result store: {} rows reused, {} evaluated".format(stats.get("reused", 0), stats.get("evaluated", 0)))
+
+    if args.cache:
+        print ("Link budget cache: {} rows, {} hits, {} misses".format(
+            stats["rows"], stats.get("hits", 0), stats.get("misses", 0)))
+
+    print ("Task Completed")
@@ -0,0 +1,182 @@
+"""
+Streaming summaries of model outputs.
+
+`RunningMoments` keeps the count, mean and variance of a stream with
+Welford's update, merged batch by batch. `QuantileSketch` is a KLL
+sketch whose size grows only logarithmically with the stream length,
+and whose quantiles are accurate to about 1.7 / k in rank. Both consume
+numpy arrays a chunk at a time and can be merged, so summaries of
+separate chunks or workers combine into the summary of the whole.
+
+"""
+import math
+import numpy as np
+
+
+class RunningMoments:
+    """
+    Count, mean and variance of a stream of values.
+
+    """
+    def __init__(self):
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        """
+        Add an array of values, ignoring NaNs.
+
+        """
+        values = np.asarray(values, dtype = float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        batch = RunningMoments()
+        batch.count = len(values)
+        batch.mean = values.mean()
+        batch.m2 = ((values - batch.mean) ** 2).sum()
+
+        return self.merge(batch)
+
+    def merge(self, other):
+        """
+        Combine with the moments of another stream.
+
+        """
+        count = self.count + other.count
+        if count == 0:
+            return self
+
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+        return self
+
+    @property
+    def var(self):
+        """
+        Sample variance, NaN below two values.
+
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def sd(self):
+        """
+        Sample standard deviation.
+
+        """
+        return math.sqrt(self.var) if self.count > 1 else np.nan
+
+
+class QuantileSketch:
+    """
+    KLL quantile sketch of a stream of values.
+
+    Parameters
+    ----------
+    k : int
+        Size of the top compactor. Larger is more accurate.
+    seed : int
+        Seed of the compaction coin flips, for reproducible sketches.
+    """
+    def __init__(self, k = 200, seed = 0):
+
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.count = 0
+
+    def _capacity(self, level):
+        """
+        Number of items a level holds before it is compacted.
+
+        """
+        depth = len(self.levels) - level - 1
+
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        """
+        Compact full levels, promoting every other sorted item.
+
+        """
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                keep = items[:1] if len(items) % 2 else items[:0]
+                items = items[len(keep):]
+                promoted = items[self.rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def update(self, values):
+        """
+        Add an array of values, ignoring NaNs.
+
+        """
+        values = np.asarray(values, dtype = float).ravel()
+        values = values[~np.isnan(values)]
+
+        for start in range(0, len(values), self.k):
+            batch = values[start:start + self.k]
+            self.levels[0] = np.concatenate([self.levels[0], batch])
+            self.count += len(batch)
+            self._compress()
+
+        return self
+
+    def merge(self, other):
+        """
+        Combine with the sketch of another stream.
+
+        """
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+
+        return self
+
+    def quantile(self, q):
+        """
+        Approximate quantiles of the stream.
+
+        Parameters
+        ----------
+        q : float or array
+            Quantiles in [0, 1].
+
+        Returns
+        -------
+        values : float or array
+            Values of the stream at those quantiles by nearest rank, not
+            interpolated, NaN if it is empty.
+        """
+        q = np.asarray(q, dtype = float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level)
+                                  for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind = "stable")
+        items, weights = items[order], weights[order]
+        cumulative = np.cumsum(weights)
+
+        index = np.searchsorted(cumulative, q * cumulative[-1], side = "left")
+        values = items[np.minimum(index, len(items) - 1)]
+
+        return values if q.ndim else values.item()
@@ -0,0 +1,257 @@
+"""
+Table input and output for the saleos pipeline.
+
+Parameter and result tables can be stored as CSV (the original format,
+kept as a compatibility export), Parquet or Feather. The columnar
+formats store string columns such as `constellation` and the
+`*_scenario` labels dictionary encoded, and let readers load only the
+columns they need.
+
+"""
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+# Columnar files keep the pandas row index in this column.
+INDEX_COLUMN = "row"
+
+
+def _require_pyarrow(fmt):
+    """
+    Raise a helpful error when a columnar format is used without pyarrow.
+
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to read and write {} tables".format(fmt))
+
+
+def _check_format(fmt):
+    """
+    Validate a table format name.
+
+    """
+    if fmt not in FORMATS:
+        raise ValueError("format must be one of {}".format(list(FORMATS)))
+
+
+def table_path(stem, fmt = "csv"):
+    """
+    Path of a table given its path without extension and its format.
+
+    """
+    _check_format(fmt)
+
+    return stem + FORMATS[fmt]
+
+
+def _string_columns(schema):
+    """
+    Names of the string columns of an Arrow schema.
+
+    """
+    return [field.name for field in schema if pa.types.is_string(field.type)
+            or pa.types.is_large_string(field.type)]
+
+
+class TableWriter:
+    """
+    Append DataFrame chunks to a CSV, Parquet or Feather table.
+
+    Parameters
+    ----------
+    stem : string
+        Path of the table without extension.
+    fmt : string
+        One of 'csv', 'parquet' or 'feather'.
+    export_csv : bool
+        Also write a CSV copy when `fmt` is columnar.
+    """
+    def __init__(self, stem, fmt = "csv", export_csv = False):
+
+        _check_format(fmt)
+        if fmt != "csv":
+            _require_pyarrow(fmt)
+
+        self.stem = stem
+        self.fmt = fmt
+        self.path = table_path(stem, fmt)
+        self.csv = TableWriter(stem, "csv") if export_csv and fmt != "csv" else None
+        self.rows = 0
+        self.schema = None
+        self.writer = None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.close()
+
+    def write(self, df):
+        """
+        Append a chunk, keeping the column types of the first chunk.
+
+        """
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode = "w" if self.rows == 0 else "a", header = self.rows == 0)
+        else:
+            table = pa.Table.from_pandas(df.rename_axis(INDEX_COLUMN).reset_index(), preserve_index = False)
+            if self.writer is None:
+                self.schema = pa.schema([pa.field(field.name, field.type.value_type)
+                                         if pa.types.is_dictionary(field.type) else field
+                                         for field in table.schema])
+                self._open()
+            self.writer.write_table(table.cast(self.schema))
+
+        if self.csv is not None:
+            self.csv.write(df)
+
+        self.rows += len(df)
+
+    def _open(self):
+        """
+        Open the underlying Arrow writer from the first chunk.
+
+        """
+        if self.fmt == "parquet":
+            self.writer = pq.ParquetWriter(self.path, self.schema, use_dictionary = _string_columns(self.schema),
+                                           compression = "zstd")
+        else:
+            self.writer = pa.ipc.new_file(self.path, self.schema,
+                                          options = pa.ipc.IpcWriteOptions(compression = "zstd"))
+
+    def close(self):
+        """
+        Finish the table files.
+
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.csv is not None:
+            self.csv.close()
+
+
+def write_table(df, stem, fmt = "csv", export_csv = False):
+    """
+    Write a whole DataFrame as a table.
+
+    Returns
+    -------
+    path : string
+        Path of the table written.
+    """
+    with TableWriter(stem, fmt, export_csv) as writer:
+        writer.write(df)
+
+    return writer.path
+
+
+def _to_frame(table):
+    """
+    Convert an Arrow table or record batch into a DataFrame indexed by row.
+
+    """
+    return table.to_pandas().set_index(INDEX_COLUMN).rename_axis(None)
+
+
+def _columnar_columns(columns):
+    """
+    Add the row index column to a column projection.
+
+    """
+    if columns is None:
+        return None
+
+    return [INDEX_COLUMN] + [column for column in columns if column != INDEX_COLUMN]
+
+
+def _csv_columns(columns):
+    """
+    Column filter for pd.read_csv that keeps the unnamed index column.
+
+    """
+    if columns is None:
+        return None
+
+    return lambda column: column in columns or column.startswith("Unnamed: 0")
+
+
+def read_table(stem, fmt = "csv", columns = None):
+    """
+    Read a table, optionally only a subset of its columns.
+
+    Parameters
+    ----------
+    stem : string
+        Path of the table without extension.
+    fmt : string
+        One of 'csv', 'parquet' or 'feather'.
+    columns : list
+        Columns to read. Columnar formats only load these from disk.
+
+    Returns
+    -------
+    df : DataFrame
+        Table indexed by row number. String columns of Parquet tables
+        come back as categoricals.
+    """
+    path = table_path(stem, fmt)
+
+    if fmt == "csv":
+        return pd.read_csv(path, index_col = 0, usecols = _csv_columns(columns))
+
+    _require_pyarrow(fmt)
+    columns = _columnar_columns(columns)
+
+    if fmt == "parquet":
+        table = pq.read_table(path, columns = columns, read_dictionary = _string_columns(pq.read_schema(path)))
+    else:
+        table = feather.read_table(path, columns = columns)
+
+    return _to_frame(table)
+
+
+def iter_table(stem, fmt = "csv", chunk_size = 100000, columns = None):
+    """
+    Read a table lazily in chunks of at most `chunk_size` rows.
+
+    Parameters are as for `read_table`. Only one chunk is held in memory
+    at a time.
+
+    Yields
+    ------
+    chunk : DataFrame
+        Consecutive rows of the table indexed by row number.
+    """
+    path = table_path(stem, fmt)
+
+    if fmt == "csv":
+        yield from pd.read_csv(path, index_col = 0, usecols = _csv_columns(columns), chunksize = chunk_size)
+        return
+
+    _require_pyarrow(fmt)
+    columns = _columnar_columns(columns)
+
+    if fmt == "parquet":
+        parquet = pq.ParquetFile(path, read_dictionary = _string_columns(pq.read_schema(path)))
+        for batch in parquet.iter_batches(batch_size = chunk_size, columns = columns):
+            yield _to_frame(batch)
+        return
+
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            for start in range(0, batch.num_rows, chunk_size):
+                yield _to_frame(batch.slice(start, chunk_size))
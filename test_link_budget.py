@@ -0,0 +1,57 @@
+"""
+Tests of the link budget cache.
+
+"""
+import numpy as np
+import link_budget as lb
+
+
+def radio_columns(rows, seed = 0):
+    """
+    Random radio inputs with `rows` distinct combinations.
+
+    """
+    rng = np.random.default_rng(seed)
+    columns = {
+        "altitude_km": rng.uniform(540, 600, rows),
+        "dl_frequency_Hz": 13.5e9,
+        "antenna_efficiency": 0.6,
+        "antenna_diameter_m": 0.7,
+        "earth_atmospheric_losses_dB": 12,
+        "all_other_losses_dB": 0.53,
+        "power_dBw": 30,
+        "receiver_gain_dB": 31,
+        "dl_bandwidth_Hz": 0.25e9,
+        "number_of_channels": 8,
+        "polarization": 2,
+        "number_of_satellites": 4425,
+        "coverage_area_per_sat_sqkm": 115279.8,
+    }
+
+    return {column: np.broadcast_to(value, (rows,)) for column, value in columns.items()}
+
+
+def test_cache_matches_uncached():
+
+    columns = radio_columns(100)
+    cached = lb.LinkBudgetCache()(columns)
+    expected = lb.capacity_columns(columns)
+
+    for column in lb.CAPACITY_COLUMNS:
+        np.testing.assert_allclose(cached[column], expected[column])
+
+
+def test_cache_eviction_keeps_hits():
+
+    cache = lb.LinkBudgetCache(max_size = 30)
+    cache(radio_columns(20))
+
+    # The first 20 rows are hits, the rest overflow the cache and evict them.
+    columns = {column: np.concatenate([first, second]) for (column, first), second in
+               zip(radio_columns(20).items(), radio_columns(3000, seed = 1).values())}
+    cached = cache(columns)
+    expected = lb.capacity_columns(columns)
+
+    for column in lb.CAPACITY_COLUMNS:
+        np.testing.assert_allclose(cached[column], expected[column])
+    assert cache.stats()["hits"] == 20
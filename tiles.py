@@ -0,0 +1,353 @@
+"""
+Local basemap tile store for the map renderers.
+
+Tiles are kept on disk as <root>/<provider>/<z>/<x>/<y>.png and evicted
+least recently used first once the store outgrows its size limit. A
+small HTTP server on localhost stands in for the tile provider, so
+contextily reads basemaps from the store. Missing tiles are fetched
+from the provider and stored, or, offline, served blank so renders on
+machines without network access never wait on an external service.
+
+"""
+import argparse
+import io
+import os
+import threading
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import mercantile
+import requests
+import contextily as ctx
+from PIL import Image
+from xyzservices import TileProvider
+
+BASEMAP = ctx.providers.CartoDB.Voyager
+
+# (west, south, east, north) in degrees and the zoom levels seeded for them.
+# add_basemap picks zoom 7 for Kenya and 4 for the continent.
+SEED_EXTENTS = {
+    "kenya": ((33.9, -4.7, 41.9, 5.5), (5, 6, 7, 8)),
+    "africa": ((-17.6, -35.0, 51.5, 37.6), (2, 3, 4, 5)),
+}
+
+MAX_BYTES = 1024 ** 3
+
+# Share of the size limit an eviction frees the store down to, so a full
+# store is only rescanned after many more tiles.
+LOW_WATER = 0.9
+
+USER_AGENT = "saleos-tile-store"
+
+
+def _blank_tile():
+    """
+    PNG bytes of a transparent 256 x 256 tile.
+
+    """
+    buffer = io.BytesIO()
+    Image.new("RGBA", (256, 256), (0, 0, 0, 0)).save(buffer, format = "PNG")
+
+    return buffer.getvalue()
+
+
+BLANK_TILE = _blank_tile()
+
+
+class TileStore:
+    """
+    Disk cache of map tiles with least recently used eviction.
+
+    Parameters
+    ----------
+    root : string
+        Folder of the store.
+    max_bytes : int
+        Size above which the least recently used tiles are deleted, down
+        to `LOW_WATER` of it.
+    """
+    def __init__(self, root, max_bytes = MAX_BYTES):
+
+        self.root = root
+        self.max_bytes = max_bytes
+        self.size = None
+        self.lock = threading.Lock()
+
+    def path(self, name, z, x, y):
+        """
+        Path of a tile in the store.
+
+        """
+        return os.path.join(self.root, name, str(z), str(x), "{}.png".format(y))
+
+    def get(self, name, z, x, y):
+        """
+        Read a tile and mark it as recently used, or return None if missing.
+
+        """
+        path = self.path(name, z, x, y)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Access times are often not updated, so recency is kept in mtime.
+        os.utime(path)
+
+        return data
+
+    def put(self, name, z, x, y, data):
+        """
+        Store a tile, evicting old tiles if the store is over its limit.
+
+        """
+        path = self.path(name, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        # Unique across the worker processes of render_batch and seed.
+        temp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, _, size in self._files())
+            else:
+                self.size += len(data)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def _files(self):
+        """
+        (mtime, path, size) of every tile in the store.
+
+        """
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".png"):
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, path, stat.st_size
+
+    def evict(self, target = None):
+        """
+        Delete least recently used tiles until the store fits a size.
+
+        Parameters
+        ----------
+        target : int
+            Size to evict down to, `LOW_WATER` of `max_bytes` by default.
+
+        Returns
+        -------
+        removed : int
+            Number of tiles deleted.
+        """
+        target = self.max_bytes * LOW_WATER if target is None else target
+        files = sorted(self._files())
+        size = sum(file_size for _, _, file_size in files)
+        removed = 0
+
+        for _, path, file_size in files:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+            removed += 1
+
+        self.size = size
+
+        return removed
+
+
+def fetch_tile(source, z, x, y, timeout = 30):
+    """
+    Download one tile from a provider.
+
+    """
+    url = source.build_url(x = x, y = y, z = z)
+    response = requests.get(url, headers = {"user-agent": USER_AGENT}, timeout = timeout)
+    response.raise_for_status()
+
+    return response.content
+
+
+def seed(store, bounds, zooms, source = BASEMAP):
+    """
+    Download the tiles of an extent that are not in the store yet.
+
+    Parameters
+    ----------
+    store : TileStore
+        Tile store to fill.
+    bounds : tuple
+        (west, south, east, north) in degrees.
+    zooms : list
+        Zoom levels to seed.
+    source : TileProvider
+        Tile provider.
+
+    Returns
+    -------
+    counts : dict
+        Number of tiles fetched and already stored.
+    """
+    counts = {"fetched": 0, "stored": 0}
+
+    for tile in mercantile.tiles(*bounds, zooms):
+        if os.path.exists(store.path(source.name, tile.z, tile.x, tile.y)):
+            counts["stored"] += 1
+            continue
+        store.put(source.name, tile.z, tile.x, tile.y, fetch_tile(source, tile.z, tile.x, tile.y))
+        counts["fetched"] += 1
+
+    return counts
+
+
+class TileServer:
+    """
+    Local HTTP stand-in for a tile provider, backed by a TileStore.
+
+    Used as a context manager, it serves tiles on a free localhost port
+    from a background thread until the block exits.
+
+    Parameters
+    ----------
+    store : TileStore
+        Tile store to serve.
+    source : TileProvider
+        Provider whose tiles are served.
+    offline : bool
+        Serve missing tiles blank instead of fetching them.
+    port : int
+        Port to listen on, a free one by default.
+    """
+    def __init__(self, store, source = BASEMAP, offline = False, port = 0):
+
+        self.store = store
+        self.source = source
+        self.offline = offline
+        self.port = port
+        self.missing = 0
+        self.httpd = None
+
+    def __enter__(self):
+
+        self.start()
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.stop()
+
+    def tile(self, z, x, y):
+        """
+        Bytes of a tile, from the store if possible.
+
+        """
+        data = self.store.get(self.source.name, z, x, y)
+        if data is not None:
+            return data
+
+        if self.offline:
+            self.missing += 1
+            return BLANK_TILE
+
+        data = fetch_tile(self.source, z, x, y)
+        self.store.put(self.source.name, z, x, y, data)
+
+        return data
+
+    def start(self):
+        """
+        Start serving from a daemon thread.
+
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                try:
+                    z, x, y = (int(part) for part in self.path.split("?")[0].strip("/")
+                               .rsplit(".", 1)[0].split("/"))
+                except ValueError:
+                    self.send_error(404)
+                    return
+                try:
+                    data = server.tile(z, x, y)
+                except requests.RequestException as e:
+                    self.send_error(502, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target = self.httpd.serve_forever, daemon = True).start()
+
+    def stop(self):
+        """
+        Stop serving and warn about tiles that were served blank.
+
+        """
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        if self.missing:
+            warnings.warn("{} basemap tiles were missing from {} and served blank".format(
+                self.missing, self.store.root))
+
+    @property
+    def provider(self):
+        """
+        TileProvider pointing contextily at this server.
+
+        """
+        return TileProvider(url = "http://127.0.0.1:{}/{{z}}/{{x}}/{{y}}.png".format(self.port),
+                            attribution = self.source.get("attribution", ""),
+                            name = self.source.name)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Seed or serve the local basemap tile store")
+    parser.add_argument("command", choices = ["seed", "serve"])
+    parser.add_argument("root", help = "folder of the tile store")
+    parser.add_argument("--extent", choices = list(SEED_EXTENTS), nargs = "+", default = ["kenya"],
+                        help = "extents to seed")
+    parser.add_argument("--zooms", type = int, nargs = "+", default = None,
+                        help = "zoom levels to seed, those of each extent by default")
+    parser.add_argument("--max-bytes", type = int, default = MAX_BYTES,
+                        help = "size of the store above which old tiles are evicted")
+    parser.add_argument("--offline", action = "store_true",
+                        help = "serve missing tiles blank instead of fetching them")
+    parser.add_argument("--port", type = int, default = 8765, help = "port served on")
+    args = parser.parse_args()
+
+    store = TileStore(args.root, args.max_bytes)
+
+    if args.command == "seed":
+        for extent in args.extent:
+            bounds, zooms = SEED_EXTENTS[extent]
+            counts = seed(store, bounds, args.zooms or zooms)
+            print("{}: {} tiles fetched, {} already stored".format(extent, counts["fetched"], counts["stored"]))
+    else:
+        with TileServer(store, offline = args.offline, port = args.port) as server:
+            print("Serving {} on {}".format(args.root, server.provider.url))
+            threading.Event().wait()
@@ -1,200 +1,302 @@
+import argparse
 import numpy as np
 import pandas as pd
-import random
-import decimal
+from dataclasses import dataclass
 from tqdm import tqdm
-from inputs import parameters, lut
-
-
-def uq_inputs_generator(): 
-    path = "C:/Users/bmwan/Desktop/5.2/Link Budget/results/"
-    uq_parameters = []
-
-    for key, item in tqdm(parameters.items(), desc = "Processing capacity, cost and emission inputs"):
-
-        # radio propagation variables
-
-        altitude = [(item["altitude_km"] - 5), item["altitude_km"], (item["altitude_km"] + 5)]
-        receiver_gain = [(item["receiver_gain"] - 5), (item["receiver_gain"]), (item["receiver_gain"] + 5)]
-        atmospheric_loss = [item["earth_atmospheric_losses"]- 3, item["earth_atmospheric_losses"], 
-                           item["earth_atmospheric_losses"] + 3]
-           
-        for alt in altitude:
-            altitude_km = alt
-            if alt == 540 or alt == 1190 or alt == 600:
-                altitude_scenario = "Low"
-            elif alt == 545 or alt == 1195 or alt == 605:
-                altitude_scenario = ""
-            else:
-                altitude_scenario = "High"
-            for rec_gain in receiver_gain:
-                receiver_gain_dB = rec_gain
-                if rec_gain == 25 or rec_gain == 26:
-                    receiver_gain_scenario = "Low"
-                elif rec_gain == 30 or rec_gain == 31:
-                    receiver_gain_scenario = "Baseline" 
-                else:
-                    receiver_gain_scenario = "High"
-                for atm_loss in atmospheric_loss:
-                    earth_atmospheric_losses_dB = atm_loss
-                    if atm_loss == 7:
-                        atmospheric_loss_scenario = "Low"
-                        cnr_scenario = "High(>13.5 dB)"
-                    elif atm_loss == 10:
-                        atmospheric_loss_scenario = "Baseline"
-                        cnr_scenario = "Baseline(7.6 - 10.5 dB)"
-                    else:
-                        atmospheric_loss_scenario = "High"
-                        cnr_scenario = "Low (<7.5 dB)"
-
-        # UQ Cost inputs 
-
-        adopt_rate = [item["adoption_rate"], 
-                     item["adoption_rate"]+0.49, item["adoption_rate"]+0.99]
-        satellite_launch = [item["satellite_launch_cost"] - 63672000, 
-                            item["satellite_launch_cost"], item["satellite_launch_cost"] + 63672000] 
-        ground_station = [item["ground_station_cost"] - (item["ground_station_cost"] * 0.2), 
-                         item["ground_station_cost"], item["ground_station_cost"] + 
-                         (item["ground_station_cost"] * 0.2)]
-        maintenance_cost = [item["maintenance"] - 3000000, item["maintenance"], item["maintenance"] + 3000000]
-
-        staff_cost = [item["staff_costs"] - 10000000, item["staff_costs"], item["staff_costs"] + 10000000]
-
-    
-        for sat_launch in satellite_launch:
-                        satellite_launch_cost = sat_launch
-                        for gst in ground_station:
-                            ground_station_cost = gst
-                            if gst == 39088000 and sat_launch == 186328000 or gst == 16000000 and \
-                                sat_launch == 86328000 or gst == 26400000 and sat_launch == 116328000:
-                                capex_scenario = "Low"
-                                sat_launch_scenario = "Low"
-                                ground_station_scenario = "Low"
-                                cost_scenario = "Low"
-                            elif gst == 48860000 and sat_launch == 250000000 or gst == 20000000 and \
-                                sat_launch == 150000000 or gst == 33000000 and sat_launch == 180000000:
-                                capex_scenario = "Baseline"
-                                sat_launch_scenario = "Baseline"
-                                ground_station_scenario = "Baseline"
-                                cost_scenario = "Baseline"
-                            else:
-                                capex_scenario = "High"
-                                sat_launch_scenario = "High"
-                                ground_station_scenario = "High"
-                                cost_scenario = "High"
-                            for maint_cost in maintenance_cost:
-                                maint_costs = maint_cost
-                                if maint_cost == maintenance_cost[0]:
-                                    opex_scenario = "Low"
-                                elif maint_cost == maintenance_cost[1]:
-                                    opex_scenario = "Baseline"
-                                elif maint_cost == maintenance_cost[2]:
-                                    opex_scenario = "High"
-                                else: 
-                                    opex_scenario = "None"
-                                for stf_cost in staff_cost:
-                                    staff_costs = stf_cost
-                                    satellite_manufacturing = item["satellite_manufacturing"]
-                                    spectrum_cost = item["spectrum_cost"] 
-                                    regulation_fees = item["regulation_fees"] 
-                                    digital_infrastructure_cost = item["digital_infrastructure_cost"]
-                                    ground_station_energy = item["ground_station_energy"]
-                                    research_development = item["research_development"] 
-                                    subscriber_acquisition = item['subscriber_acquisition']
-                                    maintenance_costs = maint_costs
-                                    capex_costs = item["satellite_manufacturing"] + item["subscriber_acquisition"] \
-                                                    + satellite_launch_cost + ground_station_cost + digital_infrastructure_cost
-                                    opex_costs = spectrum_cost + spectrum_cost + ground_station_energy \
-                                                + staff_costs + research_development + maintenance_costs 
-                                    number_of_satellites = item["number_of_satellites"]
-                                    name = item["name"]
-                                    iterations = item['iterations']
-                                    seed_value = item['seed_value']
-                                    mu = item['mu']
-                                    sigma = item['sigma']
-                                    total_area_kenya_km_sq = item["total_area_kenya_km_sq"]
-                                    total_area_earth_km_sq = item["total_area_earth_km_sq"]
-                                    coverage_area_per_sat_sqkm = item["total_area_kenya_km_sq"] / item["number_of_satellites"]
-                                    dl_bandwidth_Hz = item["dl_bandwidth"]
-                                    speed_of_light = item["speed_of_light"]
-                                    antenna_diameter_m = item["antenna_diameter"]
-                                    antenna_efficiency = item["antenna_efficiency"]
-                                    power_dBw = item["power"]
-                                    all_other_losses_dB = item["all_other_losses"] 
-                                    number_of_channels = item["number_of_channels"]
-                                    polarization = item["polarization"]
-                                    traffic_percent = item["percent_of_traffic"]
-                                    monthly_traffic_GB = item["monthly_traffic_GB"]+5
-                                    fuel_mass_kg = item["fuel_mass"]
-                                    fuel_mass_1_kg = item["fuel_mass_1"]
-                                    fuel_mass_2_kg = item["fuel_mass_2"]
-                                    fuel_mass_3_kg = item["fuel_mass_3"]
-                                    discount_rate = item["discount_rate"]
-                                    assessment_period_year = item["assessment_period"]
-                                    
-                                    
-                                    
-
-                    #  Storing in CSV
-                    
-                                    uq_parameters.append({"constellation": name, 
-                                                            "iterations": iterations,
-                                                            "seed_value": seed_value,
-                                                            "mu": mu,
-                                                            "sigma": sigma,
-                                                            "number_of_satellites": number_of_satellites,
-                                                            "total_area_earth_km_sq": total_area_earth_km_sq,
-                                                            "total_area_kenya_km_sq": total_area_kenya_km_sq,
-                                                            "coverage_area_per_sat_sqkm": total_area_earth_km_sq / number_of_satellites,
-                                                            "satellites_required_for_kenya": total_area_kenya_km_sq/ coverage_area_per_sat_sqkm,
-                                                            "altitude_km": altitude_km,
-                                                            "altitude_scenario": altitude_scenario,
-                                                            "dl_frequency_Hz": item["dl_frequency"],
-                                                            "dl_bandwidth_Hz": dl_bandwidth_Hz,
-                                                            "speed_of_light": speed_of_light,
-                                                            "antenna_diameter_m": antenna_diameter_m,
-                                                            "antenna_efficiency": antenna_efficiency,
-                                                            "power_dBw": power_dBw,
-                                                            "receiver_gain_dB": receiver_gain_dB,
-                                                            "receiver_gain_scenario": receiver_gain_scenario,
-                                                            "earth_atmospheric_losses_dB": earth_atmospheric_losses_dB,
-                                                            "atmospheric_loss_scenario": atmospheric_loss_scenario,
-                                                            "all_other_losses_dB": all_other_losses_dB,
-                                                            "number_of_channels": number_of_channels,
-                                                            "cnr_scenario": cnr_scenario,
-                                                            "polarization": polarization,
-                                                            "monthly_traffic_GB": monthly_traffic_GB,
-                                                            "percent_of_traffic": traffic_percent,
-                                                            "subscribers_low": item["subscribers"][0],
-                                                            "subscribers_baseline": item["subscribers"][1],
-                                                            "subscribers_high": item["subscribers"][2],
-                                                            "fuel_mass_kg": fuel_mass_kg,
-                                                            "fuel_mass_1_kg": fuel_mass_1_kg,
-                                                            "fuel_mass_2_kg": fuel_mass_2_kg,
-                                                            "fuel_mass_3_kg": fuel_mass_3_kg,
-                                                            "satellite_manufacturing": satellite_manufacturing,
-                                                            "satellite_launch_cost": satellite_launch_cost,
-                                                            "satellite_launch_scenario": sat_launch_scenario,
-                                                            "ground_station_cost": ground_station_cost,
-                                                            "ground_station_scenario": ground_station_scenario,
-                                                            "spectrum_cost": spectrum_cost,
-                                                            "regulation_fees": regulation_fees,
-                                                            "digital_infrastructure_cost": digital_infrastructure_cost,
-                                                            "ground_station_energy": ground_station_energy,
-                                                            "subscriber_acquisition": subscriber_acquisition,
-                                                            "staff_costs": staff_costs,
-                                                            "research_development": research_development,
-                                                            "maintenance_costs": maintenance_costs,
-                                                            "discount_rate": discount_rate,
-                                                            "assessment_period_year": assessment_period_year,
-                                                            "opex_costs": opex_costs,
-                                                            "opex_scenario": opex_scenario,
-                                                            "capex_costs": capex_costs,
-                                                            "capex_scenario": capex_scenario,
-                                                            "cost_scenario": cost_scenario,
-                                                            })  
-    df = pd.DataFrame.from_dict(uq_parameters)
-    df.to_csv(path + "uq_parameters.csv")
-            
-    return df.shape
-uq_inputs_generator()
\ No newline at end of file
+from inputs import parameters
+from registry import load, records
+from table_io import FORMATS, TableWriter
+
+path = "C:/Users/bmwan/Desktop/5.2/Link Budget/results/"
+
+SCENARIO_LABELS = ("Low", "Baseline", "High")
+
+CNR_SCENARIOS = ("High(>13.5 dB)", "Baseline(7.6 - 10.5 dB)", "Low (<7.5 dB)")
+
+# Swept inputs: (output column, parameters key, offset, relative, scenario column).
+# Each axis takes the values base - offset, base and base + offset, or
+# base * (1 -/+ offset) when relative.
+AXIS_SPECS = [
+    ("altitude_km", "altitude_km", 5, False, "altitude_scenario"),
+    ("receiver_gain_dB", "receiver_gain", 5, False, "receiver_gain_scenario"),
+    ("earth_atmospheric_losses_dB", "earth_atmospheric_losses", 3, False, "atmospheric_loss_scenario"),
+    ("satellite_launch_cost", "satellite_launch_cost", 63672000, False, "satellite_launch_scenario"),
+    ("ground_station_cost", "ground_station_cost", 0.2, True, "ground_station_scenario"),
+    ("maintenance_costs", "maintenance", 3000000, False, "opex_scenario"),
+    ("staff_costs", "staff_costs", 10000000, False, None),
+]
+
+COLUMNS = [
+    "constellation", "iterations", "seed_value", "mu", "sigma", "number_of_satellites",
+    "total_area_earth_km_sq", "total_area_kenya_km_sq", "coverage_area_per_sat_sqkm",
+    "satellites_required_for_kenya", "altitude_km", "altitude_scenario", "dl_frequency_Hz",
+    "dl_bandwidth_Hz", "speed_of_light", "antenna_diameter_m", "antenna_efficiency",
+    "power_dBw", "receiver_gain_dB", "receiver_gain_scenario", "earth_atmospheric_losses_dB",
+    "atmospheric_loss_scenario", "all_other_losses_dB", "number_of_channels", "cnr_scenario",
+    "polarization", "monthly_traffic_GB", "percent_of_traffic", "subscribers_low",
+    "subscribers_baseline", "subscribers_high", "fuel_mass_kg", "fuel_mass_1_kg",
+    "fuel_mass_2_kg", "fuel_mass_3_kg", "number_of_missions", "satellite_manufacturing", "satellite_launch_cost",
+    "satellite_launch_scenario", "ground_station_cost", "ground_station_scenario",
+    "spectrum_cost", "regulation_fees", "digital_infrastructure_cost", "ground_station_energy",
+    "subscriber_acquisition", "staff_costs", "research_development", "maintenance_costs",
+    "discount_rate", "assessment_period_year", "opex_costs", "opex_scenario", "capex_costs",
+    "capex_scenario", "cost_scenario",
+]
+
+
+@dataclass(frozen = True)
+class ScenarioAxis:
+    """
+    One swept input of the scenario grid.
+
+    Parameters
+    ----------
+    column : string
+        Output column holding the axis values.
+    values : tuple
+        Values taken along the axis, ordered low to high.
+    scenario : string
+        Output column holding the scenario label of each position, if any.
+    labels : tuple
+        Scenario label of each position.
+    """
+    column: str
+    values: tuple
+    scenario: str = None
+    labels: tuple = SCENARIO_LABELS
+
+    @classmethod
+    def from_offset(cls, column, base, offset, relative = False, scenario = None):
+        """
+        Build a low/baseline/high axis around a baseline value.
+
+        """
+        delta = base * offset if relative else offset
+
+        return cls(column, (base - delta, base, base + delta), scenario)
+
+    def __len__(self):
+
+        return len(self.values)
+
+
+def constellation_axes(item, specs = AXIS_SPECS):
+    """
+    Build the scenario axes of one constellation from its registry record.
+
+    Parameters
+    ----------
+    item : record
+        Constellation record of `registry.records`.
+    specs : list
+        Axis specifications, as in `AXIS_SPECS`.
+
+    Returns
+    -------
+    axes : list
+        List of ScenarioAxis, outermost first.
+    """
+    return [ScenarioAxis.from_offset(column, item[key], offset, relative, scenario)
+            for column, key, offset, relative, scenario in specs]
+
+
+def grid_size(axes):
+    """
+    Number of scenarios in the Cartesian product of the axes.
+
+    """
+    return int(np.prod([len(axis) for axis in axes], dtype = np.int64))
+
+
+def constellation_columns(item):
+    """
+    Columns that stay constant across the scenario grid of a constellation.
+
+    """
+    return {
+        "constellation": str(item["name"]),
+        "iterations": item["iterations"],
+        "seed_value": item["seed_value"],
+        "mu": item["mu"],
+        "sigma": item["sigma"],
+        "number_of_satellites": item["number_of_satellites"],
+        "total_area_earth_km_sq": item["total_area_earth_km_sq"],
+        "total_area_kenya_km_sq": item["total_area_kenya_km_sq"],
+        "coverage_area_per_sat_sqkm": item["total_area_earth_km_sq"] / item["number_of_satellites"],
+        "satellites_required_for_kenya": item["number_of_satellites"],
+        "dl_frequency_Hz": item["dl_frequency"],
+        "dl_bandwidth_Hz": item["dl_bandwidth"],
+        "speed_of_light": item["speed_of_light"],
+        "antenna_diameter_m": item["antenna_diameter"],
+        "antenna_efficiency": item["antenna_efficiency"],
+        "power_dBw": item["power"],
+        "all_other_losses_dB": item["all_other_losses"],
+        "number_of_channels": item["number_of_channels"],
+        "polarization": item["polarization"],
+        "monthly_traffic_GB": item["monthly_traffic_GB"] + 5,
+        "percent_of_traffic": item["percent_of_traffic"],
+        "subscribers_low": item["subscribers"][0],
+        "subscribers_baseline": item["subscribers"][1],
+        "subscribers_high": item["subscribers"][2],
+        "fuel_mass_kg": item["fuel_mass"],
+        "fuel_mass_1_kg": item["fuel_mass_1"],
+        "fuel_mass_2_kg": item["fuel_mass_2"],
+        "fuel_mass_3_kg": item["fuel_mass_3"],
+        "number_of_missions": item["number_of_missions"],
+        "satellite_manufacturing": item["satellite_manufacturing"],
+        "spectrum_cost": item["spectrum_cost"],
+        "regulation_fees": item["regulation_fees"],
+        "digital_infrastructure_cost": item["digital_infrastructure_cost"],
+        "ground_station_energy": item["ground_station_energy"],
+        "subscriber_acquisition": item["subscriber_acquisition"],
+        "research_development": item["research_development"],
+        "discount_rate": item["discount_rate"],
+        "assessment_period_year": item["assessment_period"],
+    }
+
+
+def axis_chunks(axes, chunk_size = 100000):
+    """
+    Lazily walk the Cartesian product of the axes in row-major order.
+
+    Parameters
+    ----------
+    axes : list
+        List of ScenarioAxis, outermost first.
+    chunk_size : int
+        Maximum number of scenarios per chunk.
+
+    Yields
+    ------
+    start : int
+        Position of the first scenario of the chunk in the grid.
+    positions : dict
+        Axis column to array of positions along that axis.
+    """
+    shape = tuple(len(axis) for axis in axes)
+    size = grid_size(axes)
+
+    for start in range(0, size, chunk_size):
+        index = np.arange(start, min(start + chunk_size, size), dtype = np.int64)
+        yield start, dict(zip([axis.column for axis in axes], np.unravel_index(index, shape)))
+
+
+def scenario_chunks(item, chunk_size = 100000, specs = AXIS_SPECS):
+    """
+    Generate the scenario grid of one constellation as column chunks.
+
+    Scenario labels come from each row's position along the axes, so
+    they stay correct whatever the baseline values are.
+
+    Parameters
+    ----------
+    item : record
+        Constellation record of `registry.records`.
+    chunk_size : int
+        Maximum number of rows per chunk.
+    specs : list
+        Axis specifications, as in `AXIS_SPECS`.
+
+    Yields
+    ------
+    chunk : DataFrame
+        Rows of the scenario grid with the columns of `COLUMNS`.
+    """
+    axes = constellation_axes(item, specs)
+    constants = constellation_columns(item)
+
+    for start, positions in axis_chunks(axes, chunk_size):
+
+        n = len(next(iter(positions.values())))
+        columns = {}
+
+        for axis in axes:
+            position = positions[axis.column]
+            columns[axis.column] = np.asarray(axis.values)[position]
+            if axis.scenario:
+                columns[axis.scenario] = np.asarray(axis.labels, dtype = object)[position]
+
+        columns["cnr_scenario"] = np.asarray(CNR_SCENARIOS, dtype = object)[
+            positions["earth_atmospheric_losses_dB"]]
+
+        # Launch and ground station costs form one capex scenario: it keeps
+        # their label when both sit at the same position and is High otherwise.
+        launch = positions["satellite_launch_cost"]
+        ground = positions["ground_station_cost"]
+        capex_scenario = np.where(launch == ground, np.asarray(SCENARIO_LABELS, dtype = object)[launch], "High")
+        columns["satellite_launch_scenario"] = capex_scenario
+        columns["ground_station_scenario"] = capex_scenario
+        columns["capex_scenario"] = capex_scenario
+        columns["cost_scenario"] = capex_scenario
+
+        for key, value in constants.items():
+            columns[key] = np.full(n, value, dtype = object if isinstance(value, str) else None)
+
+        columns["capex_costs"] = columns["satellite_manufacturing"] + columns["subscriber_acquisition"] \
+                                + columns["satellite_launch_cost"] + columns["ground_station_cost"] \
+                                + columns["digital_infrastructure_cost"]
+        columns["opex_costs"] = columns["spectrum_cost"] + columns["spectrum_cost"] \
+                                + columns["ground_station_energy"] + columns["staff_costs"] \
+                                + columns["research_development"] + columns["maintenance_costs"]
+
+        yield pd.DataFrame({column: columns[column] for column in COLUMNS}, index = pd.RangeIndex(start, start + n))
+
+
+def generate_scenarios(params = parameters, chunk_size = 100000, specs = AXIS_SPECS):
+    """
+    Generate the scenario grids of every constellation as column chunks.
+
+    Chunks never span two constellations. The index of each chunk is the
+    global row number, so chunks can be written or evaluated separately
+    and still be put back in order. `params` is a parameters dict or a
+    registry record array.
+
+    """
+    offset = 0
+
+    for item in tqdm(records(params), desc = "Processing capacity, cost and emission inputs"):
+        for chunk in scenario_chunks(item, chunk_size, specs):
+            chunk.index = chunk.index + offset
+            yield chunk
+        offset += grid_size(constellation_axes(item, specs))
+
+
+def uq_inputs_generator(chunk_size = 100000, fmt = "csv", export_csv = False, params = parameters):
+    """
+    Write the scenario grid of every constellation to uq_parameters.
+
+    Parameters
+    ----------
+    chunk_size : int
+        Maximum number of rows generated and written at a time.
+    fmt : string
+        Table format, one of 'csv', 'parquet' or 'feather'.
+    export_csv : bool
+        Also write uq_parameters.csv when `fmt` is columnar.
+    params : dict
+        Constellation parameters or registry record array.
+
+    Returns
+    -------
+    shape : tuple
+        Number of rows and columns written.
+    """
+    with TableWriter(path + "uq_parameters", fmt, export_csv) as writer:
+        for chunk in generate_scenarios(params, chunk_size):
+            writer.write(chunk)
+
+    return (writer.rows, len(COLUMNS))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Generate the uq_parameters scenario table")
+    parser.add_argument("--format", choices = list(FORMATS), default = "csv",
+                        help = "table format of uq_parameters")
+    parser.add_argument("--export-csv", action = "store_true",
+                        help = "also write uq_parameters.csv for a columnar format")
+    parser.add_argument("--registry", nargs = "+", default = [], metavar = "FILE",
+                        help = "TOML or JSON constellation files adding to, or overriding, inputs.parameters")
+    args = parser.parse_args()
+
+    uq_inputs_generator(fmt = args.format, export_csv = args.export_csv, params = load(args.registry, parameters))
@@ -0,0 +1,283 @@
+"""
+Satellites in view over time, from propagated Walker-delta shells.
+
+Each shell of `geometry.shell_table` is laid out as an idealised
+Walker-delta constellation of circular orbits and propagated over a
+time grid, with the Earth turning underneath. A satellite is in view of
+a cell when the central angle between the cell and the sub-satellite
+point is within the cap of the terminals' minimum elevation, i.e. when
+their unit vectors in Earth-fixed (ECEF) coordinates are within a
+chord distance. The cells go into a KD-tree once and the satellites of
+each timestep into another, and the two trees are walked together for
+the pairs within that radius, so the cost grows with the number of
+satellites actually in view rather than with satellites x cells.
+
+Time chunks of each constellation are counted on a process pool, and
+the counts of its shells are added before the per-cell mean, minimum
+and share of time with a satellite in view are taken.
+
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from geometry import DATA_GEO, central_angle, EARTH_RADIUS_KM, path, region_centroids, shell_table
+from inputs import parameters
+from registry import load
+from table_io import FORMATS, write_table
+
+EARTH_MU = 398600.4418  # Gravitational parameter of the Earth (km^3/s^2)
+EARTH_ROTATION = 7.2921159e-5  # Sidereal rotation rate of the Earth (rad/s)
+
+DURATION_S = 86400
+STEP_S = 60
+
+# Timesteps counted per task.
+TIME_CHUNK = 120
+
+VISIBILITY_COLUMNS = ["GID_1", "constellation", "mean_visible", "min_visible", "coverage"]
+
+
+def default_planes(satellites):
+    """
+    Number of orbital planes of a shell: the divisor of its satellite count closest to the square root.
+
+    """
+    divisors = np.flatnonzero(satellites % np.arange(1, int(satellites) + 1) == 0) + 1
+
+    return int(divisors[np.argmin(np.abs(divisors - np.sqrt(satellites)))])
+
+
+def walker_delta(satellites, planes = None, phasing = 1):
+    """
+    Right ascension of the node and initial argument of latitude of a Walker-delta shell.
+
+    Parameters
+    ----------
+    satellites : int
+        Total number of satellites t.
+    planes : int
+        Number of equally spaced planes p, which must divide t. Defaults
+        to `default_planes`.
+    phasing : int
+        Phasing factor f, shifting each plane by 2 pi f / t.
+
+    Returns
+    -------
+    raan, anomaly : array
+        Angles of each satellite in radians.
+    """
+    satellites = int(satellites)
+    planes = default_planes(satellites) if planes is None else int(planes)
+    if satellites % planes:
+        raise ValueError("{} planes do not divide {} satellites".format(planes, satellites))
+
+    per_plane = satellites // planes
+    plane, slot = np.divmod(np.arange(satellites), per_plane)
+
+    return 2 * np.pi * plane / planes, 2 * np.pi * slot / per_plane + 2 * np.pi * phasing * plane / satellites
+
+
+def positions(raan, anomaly, altitude_km, inclination_deg, times):
+    """
+    Unit ECEF vectors of the sub-satellite points at each time.
+
+    Parameters
+    ----------
+    raan, anomaly : array
+        Angles of each satellite at time zero, from `walker_delta`.
+    altitude_km : float
+        Orbit altitude.
+    inclination_deg : float
+        Orbit inclination.
+    times : array
+        Seconds since time zero.
+
+    Returns
+    -------
+    vectors : array
+        Shape (times, satellites, 3).
+    """
+    motion = np.sqrt(EARTH_MU / (EARTH_RADIUS_KM + altitude_km) ** 3)
+    times = np.asarray(times, dtype = float)[:, None]
+    argument = anomaly + motion * times
+    inclination = np.radians(inclination_deg)
+
+    # The node angle relative to the turning Earth fixes the ECEF longitude.
+    node = raan - EARTH_ROTATION * times
+    x = np.cos(node) * np.cos(argument) - np.sin(node) * np.sin(argument) * np.cos(inclination)
+    y = np.sin(node) * np.cos(argument) + np.cos(node) * np.sin(argument) * np.cos(inclination)
+    z = np.broadcast_to(np.sin(argument) * np.sin(inclination), x.shape)
+
+    return np.stack([x, y, z], axis = -1)
+
+
+def cell_vectors(latitude_deg, longitude_deg):
+    """
+    Unit ECEF vectors of cells, shape (cells, 3).
+
+    """
+    latitude, longitude = np.radians(latitude_deg), np.radians(longitude_deg)
+
+    return np.stack([np.cos(latitude) * np.cos(longitude), np.cos(latitude) * np.sin(longitude),
+                     np.sin(latitude)], axis = -1)
+
+
+def visibility_radius(altitude_km, min_elevation_deg):
+    """
+    Chord between unit vectors within which a satellite is above the minimum elevation.
+
+    """
+    return 2 * np.sin(central_angle(altitude_km, min_elevation_deg) / 2)
+
+
+def count_chunk(cells, shells, times):
+    """
+    Satellites in view of each cell at each of a chunk of times.
+
+    Parameters
+    ----------
+    cells : array
+        Unit ECEF vectors of the cells, shape (cells, 3).
+    shells : list
+        (altitude_km, inclination_deg, satellites, min_elevation_deg)
+        of each shell, counted together.
+    times : array
+        Seconds since time zero.
+
+    Returns
+    -------
+    counts : array
+        Shape (times, cells).
+    """
+    counts = np.zeros((len(times), len(cells)), dtype = np.int32)
+    cell_tree = cKDTree(cells)
+
+    for altitude, inclination, satellites, min_elevation in shells:
+        raan, anomaly = walker_delta(satellites)
+        vectors = positions(raan, anomaly, altitude, inclination, times)
+        radius = visibility_radius(altitude, min_elevation)
+        for step, satellite_vectors in enumerate(vectors):
+            pairs = cKDTree(satellite_vectors).sparse_distance_matrix(cell_tree, radius, output_type = "ndarray")
+            counts[step] += np.bincount(pairs["j"], minlength = len(cells)).astype(np.int32)
+
+    return counts
+
+
+def _summarize_chunk(cells, shells, times):
+    """
+    Sum, minimum and covered timesteps of each cell over a chunk of times.
+
+    """
+    counts = count_chunk(cells, shells, times)
+
+    return counts.sum(axis = 0, dtype = np.int64), counts.min(axis = 0), (counts > 0).sum(axis = 0)
+
+
+def constellation_visibility(latitude_deg, longitude_deg, shells, times, workers = 1, time_chunk = TIME_CHUNK):
+    """
+    Time statistics of the satellites in view of each cell.
+
+    Parameters
+    ----------
+    latitude_deg, longitude_deg : array
+        Cell coordinates, shape (cells,).
+    shells : DataFrame
+        Shells of one constellation with the `geometry.SHELL_COLUMNS`.
+    times : array
+        Time grid in seconds.
+    workers : int
+        Number of worker processes, 1 counts in this process.
+    time_chunk : int
+        Timesteps per task.
+
+    Returns
+    -------
+    visibility : dict
+        'mean_visible', 'min_visible' and 'coverage', the share of
+        timesteps with at least one satellite in view, per cell.
+    """
+    cells = cell_vectors(latitude_deg, longitude_deg)
+    shells = list(shells[["altitude_km", "inclination_deg", "number_of_satellites",
+                          "min_elevation_deg"]].itertuples(index = False, name = None))
+    chunks = [times[start:start + time_chunk] for start in range(0, len(times), time_chunk)]
+
+    if workers <= 1:
+        parts = [_summarize_chunk(cells, shells, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            parts = list(pool.map(_summarize_chunk, [cells] * len(chunks), [shells] * len(chunks), chunks))
+
+    total, minimum, covered = zip(*parts)
+
+    return {
+        "mean_visible": np.sum(total, axis = 0) / len(times),
+        "min_visible": np.min(minimum, axis = 0),
+        "coverage": np.sum(covered, axis = 0) / len(times),
+    }
+
+
+def region_visibility(regions, shells, duration_s = DURATION_S, step_s = STEP_S, workers = 1):
+    """
+    Satellites in view of every region for every constellation.
+
+    Parameters
+    ----------
+    regions : DataFrame
+        One row per region with GID_1, latitude and longitude columns,
+        e.g. from `geometry.region_centroids`.
+    shells : DataFrame
+        Shells with the `geometry.SHELL_COLUMNS`, e.g. from
+        `geometry.shell_table`.
+    duration_s : float
+        Length of the time grid in seconds.
+    step_s : float
+        Timestep in seconds.
+    workers : int
+        Number of worker processes.
+
+    Returns
+    -------
+    visibility : DataFrame
+        One row per (constellation, region) with the `VISIBILITY_COLUMNS`.
+    """
+    times = np.arange(0, duration_s, step_s, dtype = float)
+    frames = []
+
+    for constellation, shell in shells.groupby("constellation", sort = False):
+        visibility = constellation_visibility(regions["latitude"].to_numpy(), regions["longitude"].to_numpy(),
+                                              shell, times, workers)
+        frame = pd.DataFrame({"GID_1": regions["GID_1"].to_numpy(), "constellation": constellation})
+        for column, values in visibility.items():
+            frame[column] = values
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index = True)[VISIBILITY_COLUMNS]
+
+
+if __name__ == '__main__':
+
+    from boundaries import regional_shapes
+
+    parser = argparse.ArgumentParser(description = "Write the satellites in view of every region over time")
+    parser.add_argument("--level", type = int, default = 2,
+                        help = "GADM level of the regions")
+    parser.add_argument("--iso3", default = "KEN",
+                        help = "country of the regions")
+    parser.add_argument("--registry", nargs = "+", default = [], metavar = "FILE",
+                        help = "TOML or JSON constellation files adding to, or overriding, inputs.parameters")
+    parser.add_argument("--duration", type = float, default = DURATION_S,
+                        help = "length of the time grid in seconds")
+    parser.add_argument("--step", type = float, default = STEP_S,
+                        help = "timestep in seconds")
+    parser.add_argument("--workers", type = int, default = 1,
+                        help = "number of worker processes")
+    parser.add_argument("--format", choices = list(FORMATS), default = "csv",
+                        help = "table format of region_visibility")
+    args = parser.parse_args()
+
+    regions = region_centroids(regional_shapes(DATA_GEO, args.level, args.iso3))
+    shells = shell_table(load(args.registry, parameters))
+    visibility = region_visibility(regions, shells, args.duration, args.step, args.workers)
+    write_table(visibility, path + "results/region_visibility", args.format)